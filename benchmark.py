@@ -0,0 +1,212 @@
+import numpy as np
+import time, timeit, math, sys, resource, multiprocessing
+from typing import List, Callable, Tuple, Any
+
+from src import agents
+from src import automaton
+from src import brushes
+from src import noise
+from src import tools
+from src.occupancy import OccupancyGrid
+
+"""
+Micro benchmarks.
+
+Run all of them: python benchmark.py
+Run some of them: python benchmark.py brush
+"""
+
+def curvePoints(count:int, h:int=480, w:int=640) -> List[Tuple[int, int]]:
+    """
+    A long wiggly path in [h w] drawing points, about 2 pixels between points, that stays on the canvas.
+    """
+    t = np.arange(count) * 0.002
+    x = h/2 + (h/2 - 20) * np.sin(3 * t) * np.cos(0.7 * t)
+    y = w/2 + (w/2 - 20) * np.sin(2 * t + 1)
+    return list(zip(np.rint(x).astype(int).tolist(), np.rint(y).astype(int).tolist()))
+
+def timeGrowingStroke(brush:Callable[[np.ndarray, List[Tuple[int, int]]], np.ndarray], points:List[Tuple[int, int]], buckets:List[int]) -> List[float]:
+    """
+    Draws the path one point at a time, like a walker does.
+    Returns the mean seconds per step for the steps up to each bucket's path length.
+    """
+    state = np.zeros((480, 640, 3), np.uint8)
+    history = []
+    step_times = []
+    for p in points:
+        history.append(p)
+        start = time.perf_counter()
+        state = brush(state, history)
+        step_times.append(time.perf_counter() - start)
+    means = []
+    previous = 0
+    for b in buckets:
+        means.append(sum(step_times[previous:b]) / (b - previous))
+        previous = b
+    return means
+
+def benchmarkBrush() -> None:
+    """
+    Cost per step of drawing a growing walker path, by path length.
+    Full redraw (simpleBorderPolyLine) against incremental (simpleBorderPolyLineStroke).
+    """
+    buckets = [100, 500, 1000, 2000, 3000, 4000, 5000]
+    points = curvePoints(buckets[-1])
+    full = timeGrowingStroke(brushes.simpleBorderPolyLine, points, buckets)
+    incremental = timeGrowingStroke(brushes.simpleBorderPolyLineStroke(), points, buckets)
+    print("brush: mean time per step (microseconds) by path length")
+    print("path length\tfull redraw\tincremental")
+    for b, f, i in zip(buckets, full, incremental):
+        print(f"{b}\t\t{f*1e6:.1f}\t\t{i*1e6:.1f}")
+
+def _noiseRun(kind:str, shape:Tuple[int, int], dtype:str, chunk_size:Any) -> Tuple[float, float]:
+    """
+    Runs in a fresh process so ru_maxrss is the peak of this run only.
+    Returns (seconds, peak RSS in MB).
+    """
+    rng = np.random.default_rng(0)
+    start = time.perf_counter()
+    if kind == "perlin":
+        noise.generate_perlin_noise_2d(shape, (8, 8), rng=rng, dtype=np.dtype(dtype), chunk_size=chunk_size)
+    else:
+        noise.generate_fractal_noise_2d(shape, (8, 8), octaves=5, rng=rng, dtype=np.dtype(dtype), chunk_size=chunk_size)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        peak /= 1024 # bytes on macOS, kilobytes on Linux
+    return elapsed, peak / 1024
+
+def benchmarkNoise() -> None:
+    """
+    Time and peak RSS of noise generation, one chunk (the whole array at once) against chunked, float64 against float32.
+    """
+    shape = (4096, 4096)
+    output_mb = shape[0] * shape[1] * 8 / (1 << 20)
+    print(f"noise: {shape[0]}x{shape[1]}, float64 output is {output_mb:.0f}MB")
+    print("kind\tdtype\tchunk\ttime (s)\tpeak RSS (MB)")
+    context = multiprocessing.get_context("spawn")
+    for kind in ["perlin", "fractal"]:
+        for dtype, chunk_size in [("float64", None), ("float64", 1024), ("float32", 1024), ("float32", 256)]:
+            with context.Pool(1) as pool:
+                elapsed, peak = pool.apply(_noiseRun, (kind, shape, dtype, chunk_size))
+            print(f"{kind}\t{dtype}\t{chunk_size}\t{elapsed:.2f}\t\t{peak:.0f}")
+
+def timeWalkers(terrain:Any, batched:bool, steps:int=200, repeats:int=5) -> float:
+    """
+    Steps a grid of walkers with a brush that draws nothing, so only the walking is timed.
+    Returns the best walker steps per second of 'repeats' runs.
+    """
+    best = 0.0
+    for _ in range(repeats):
+        agent_buffer:List[agents.Agent] = []
+        agents.VectorFieldWalkerFactory_2(terrain, agent_buffer, 10, batched=batched)
+        for agent in agent_buffer:
+            agent.brush = lambda state, *args, **kwargs: state
+            agent.lifespan = steps
+            agent.aging_rate = 1
+        state = np.zeros((480, 640, 3), np.uint8)
+        walker_steps = 0
+        start = time.perf_counter()
+        for step in range(steps):
+            for agent in agent_buffer:
+                if not agent.dead:
+                    state = agent.doStep(step, state, terrain)
+                    walker_steps += int(agent.alive.sum()) if batched else 1
+        best = max(best, walker_steps / (time.perf_counter() - start))
+    return best
+
+def benchmarkWalker() -> None:
+    """
+    Walker steps per second with a plain terrain (cos and sin every step) against a UnitVectorField (lookup tables),
+    and the cost of the lookup alone.
+    """
+    rng = np.random.default_rng(0)
+    terrain = noise.generate_perlin_noise_2d((480, 640), (8, 8), rng=rng)
+    terrain = (terrain - terrain.min()) * math.pi / (terrain.max() - terrain.min())
+    field = agents.UnitVectorField(terrain)
+    print("walker: steps per second, 3072 walkers")
+    print("walkers		terrain		unit vector field")
+    for batched in [False, True]:
+        plain_rate = timeWalkers(terrain, batched)
+        field_rate = timeWalkers(field, batched)
+        print(f"{'population' if batched else 'objects'}	{plain_rate:.0f}		{field_rate:.0f}")
+    walker = agents.VectorFieldWalker([], (240, 320), 2, 0)
+    lookups = 100000
+    plain_time = min(timeit.repeat(lambda: walker.lookupDirection(terrain), number=lookups, repeat=5))
+    field_time = min(timeit.repeat(lambda: walker.lookupDirection(field), number=lookups, repeat=5))
+    print(f"lookupDirection (microseconds)\t{plain_time/lookups*1e6:.2f}\t\t{field_time/lookups*1e6:.2f}")
+
+def benchmarkAutomaton() -> None:
+    """
+    Steps per second of the generator_v1 boxel automaton, by grid size.
+    """
+    rng = np.random.default_rng(0)
+    print("automaton: steps per second")
+    print("grid		steps/s")
+    for size in [79, 500, 1000, 2000]:
+        engine = automaton.BoxelAutomaton(automaton.randomBoxels(size, size, rng))
+        state = automaton.cycleState(size, size, 23)
+        steps = 0
+        start = time.perf_counter()
+        while time.perf_counter() - start < 1:
+            state = engine.step(state, 23, rng)
+            steps += 1
+        print(f"{size}x{size}	{steps/(time.perf_counter()-start):.1f}")
+
+def benchmarkFrost() -> None:
+    """
+    Crystal steps per second growing FrostDrawers one object at a time against a FrostPopulation, by seed point count.
+    """
+    h, w = 720, 1080
+    # four flat colour regions for the crystals to stop at
+    image = np.zeros((h, w, 3), np.uint8)
+    image[:, w//2:] = [10, 20, 30]
+    image[h//2:] += 5
+    print("frost: crystal steps per second, until every crystal is dead")
+    print("seeds	objects		population")
+    for seeds in [4, 40]:
+        rates = []
+        for batched in [False, True]:
+            state = image.copy()
+            occupancy = OccupancyGrid((h, w))
+            rng = np.random.default_rng(0)
+            crystal_steps = 0
+            start = time.perf_counter()
+            if batched:
+                population = agents.FrostPopulation((h, w), occupancy, rng)
+                for _ in range(seeds):
+                    population.addAroundRandomSeedPoint(60)
+                step = 0
+                while not population.dead:
+                    crystal_steps += int(population.alive.sum())
+                    state = population.step(step, state, image)
+                    step += 1
+            else:
+                cursors:List[agents.Agent] = []
+                for _ in range(seeds):
+                    agents.getFrostDrawerAroundRandomSeedPoint(h, w, 60, cursors, occupancy, rng)
+                step = 0
+                while len(cursors) > 0:
+                    for cursor in cursors:
+                        state = cursor.step(step, state, image)
+                        crystal_steps += 1
+                    tools.removeDead(cursors)
+                    step += 1
+            rates.append(crystal_steps / (time.perf_counter() - start))
+        print(f"{seeds}	{rates[0]:.0f}		{rates[1]:.0f}")
+
+BENCHMARKS = {
+    "brush": benchmarkBrush,
+    "noise": benchmarkNoise,
+    "walker": benchmarkWalker,
+    "automaton": benchmarkAutomaton,
+    "frost": benchmarkFrost,
+}
+
+def main():
+    names = sys.argv[1:] or list(BENCHMARKS.keys())
+    for name in names:
+        BENCHMARKS[name]()
+
+if __name__ == "__main__":
+    main()
@@ -3,15 +3,19 @@ from pygame.locals import *
 import numpy as np
 from PIL import Image
 import cv2
-import datetime, time, random, sys, math, traceback
+import datetime, time, sys, math, traceback, argparse, os
 from collections import deque
 from typing import List, Callable, Any, Tuple
 
 from src import tools
+from src.recorder import VideoRecorder
+from src.display import Display
+from src.simulation import SimulationThread
 from src import waiter as wait
 from src import noise
 from src import agents
 from src import brushes
+from src import parallel
 
 """
 V7 - flow paths
@@ -22,17 +26,6 @@ V7 - flow paths
 StateArray = Any
 ImageArray = Any
 
-def draw(screen:pygame.surface.Surface, state:ImageArray) -> None:
-    img = state.copy()
-    # swap axes from cv2 [x][y] style to pygame [y][x] style
-    img = np.swapaxes(img, 0, 1)
-    # move BGR to RGB
-    img = img[...,::-1]
-    surface = pygame.surfarray.make_surface(img)
-    screen.blit(surface, (0, 0))
-    pygame.display.update()
-
-
 def updateState(step:int, state:StateArray, terrain:StateArray, agent_buffer: List[agents.Agent]) -> StateArray:
     #print(len(agent_buffer))
     if len(agent_buffer) < 10:
@@ -40,16 +33,16 @@ def updateState(step:int, state:StateArray, terrain:StateArray, agent_buffer: Li
         #getCrystalAgentsAroundRandomSeedPoint(state.shape[0], state.shape[1], 60, agent_buffer)
         #agent_buffer = agents.VectorFieldWalkerFactory_1(terrain, agent_buffer, 1)
         pass
+    # agents spawned during the step are appended and also take this step.
     for agent in agent_buffer:
         state = agent.doStep(step, state, terrain)
-        if agent.dead:
-            agent_buffer.remove(agent)
+    tools.removeDead(agent_buffer)
     return state
 
-def updateStateHistory(step:int, every:int, state:StateArray, state_history:List[StateArray]) -> List[StateArray]:
+def updateStateHistory(step:int, every:int, state:StateArray, recorder:VideoRecorder) -> VideoRecorder:
     if step % every == 0:
-        state_history.append(state.copy())
-    return state_history
+        recorder.record(state)
+    return recorder
 
 def doNothing(t:Tuple[int,int]) -> None:
     pass
@@ -78,20 +71,39 @@ def handleEvents(pygame:Any, mouseCallback:Callable[[Tuple[int,int]],None]=doNot
 
 MAX_VAL = 255
 
-# CANVAS_H, CANVAS_W = 720, 1280 # overwritten when an image is loaded
-#@profile # for profiling, uncomment this line and run: python -m memory_profiler generator.py
-def main():
-    print("Loading...")
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="V7 - flow paths")
+    parser.add_argument("--headless", action="store_true",
+            help="Run without a pygame window and save the result when done.")
+    parser.add_argument("--max-steps", type=int, default=1000,
+            help="Step budget for --headless runs. The run also ends when no agents are left.")
+    parser.add_argument("--output", default="output",
+            help="Directory the image and video are written to.")
+    parser.add_argument("--processes", type=int, default=1,
+            help="For --headless runs, render walker populations (batched factories) across this many processes. "
+                "Their steps are recorded as a single video frame.")
+    parser.add_argument("--seed", type=int, default=None,
+            help="Seed for every random choice. Runs with the same seed and config produce identical frames.")
+    return parser.parse_args()
+
+def setup(rng:np.random.Generator) -> Tuple[StateArray, StateArray, List[agents.Agent]]:
     """
     Config
     openCV uses (W,H) .. (H,W) am I losing my mind?
     pygame uses (H,W)
     In this script use: (H,W) for drawing
+    Returns the initial (state, terrain, agent_buffer)
     """
-    steps_per_frame = 1
+    canvas_shape = (480, 640) # overwritten when an image is loaded
+    image_path = None # eg: "img_in/g.jpeg" to draw over a photo instead of the noise
     image_scale_percent = 15
+    image = None
+    if image_path is not None:
+        image = tools.loadCVImage(image_path, scale_percent=image_scale_percent)
+        canvas_shape = image.shape[:2]
 
-    noise_arr = noise.generate_perlin_noise_2d((480, 640), (4, 4), tileable=(False, False))
+    # terrain matches the canvas exactly, whatever its size
+    noise_arr = noise.generate_perlin_noise_2d(canvas_shape, (4, 4), tileable=(False, False), rng=rng)
     print("max", np.amax(noise_arr))
     print("min", np.amin(noise_arr))
     noise_arr += abs(noise_arr.min())
@@ -102,38 +114,115 @@ def main():
                                        # uses 180 degrees because walkers are symmetric (forward and backward)
     print("max", np.amax(terrain))
     print("min", np.amin(terrain))
+    terrain = agents.UnitVectorField(terrain) # walkers look their step up instead of calling cos and sin
 
     noise_arr = np.stack((noise_arr,)*3, axis=-1) # convert from 2d to 3d
     noise_arr *= 255/noise_arr.max() # Normalize/scale values between 0-255
 
     print("max", np.amax(noise_arr))
     print("min", np.amin(noise_arr))
-    state = noise_arr.copy()
+    state = noise_arr.astype(np.uint8) # PIL and the video writer only accept uint8 images
+    if image is not None:
+        state = image
+
+    agent_buffer:List[agents.Agent] = []
+    agents.VectorFieldVisualizerFactory(terrain, agent_buffer, 30)
+    #agents.VectorFieldWalkerFactory_1(terrain, agent_buffer, 10, rng=rng)
+    #agents.VectorFieldWalkerFactory_2(terrain, agent_buffer, 100)
+    #agents.VectorFieldWalkerFactory_2(terrain, agent_buffer, 10, batched=True) # can be rendered with --processes
+    agents.VectorFieldWalkerFactory_3(terrain, agent_buffer, 30)
+    #agents.VectorFieldWalkerFactory_4(terrain, agent_buffer, 20, integrator="rk4") # evenly spaced walkers
+    print(f"agents: {len(agent_buffer)}")
+    return state, terrain, agent_buffer
+
+def getOutputPaths(output_dir:str) -> Tuple[str, str]:
+    timestamp = int(datetime.datetime.now().timestamp())
+    output_image_path = os.path.join(output_dir, f"time{timestamp}.png")
+    output_video_path = os.path.join(output_dir, f"time{timestamp}.avi")
+    return output_image_path, output_video_path
+
+def runHeadless(max_steps:int, output_dir:str, rng:np.random.Generator, processes:int=1) -> None:
+    """
+    Runs the updateState loop without a display until max_steps is reached or no agents are left,
+    then saves the image + video.
+    No pygame display, font or event handling is initialised.
+    With processes > 1, walker populations are rendered first across a process pool (see src/parallel.py)
+    and the remaining agents are then stepped as normal from step 0, so they get the whole max_steps as well.
+    The populations are rendered in one go, so the video only gets a single frame for all of their steps.
+    """
+    print("Loading...")
+    steps_per_frame = 1
+    state, terrain, agent_buffer = setup(rng)
+    output_image_path, output_video_path = getOutputPaths(output_dir)
+    print("Loading complete.")
+
+    step = 0
+    population_steps = 0
+    start = time.perf_counter()
+    first_frame = state.copy()
+    if processes > 1:
+        # before the recorder starts its thread, the worker processes are forked
+        state, population_steps = parallel.renderPopulations(state, terrain, agent_buffer, processes, max_steps=max_steps)
+    recorder = VideoRecorder(output_video_path)
+    recorder.record(first_frame)
+    if processes > 1:
+        recorder.record(state) # one frame for every population step
+    while step < max_steps and len(agent_buffer) > 0:
+        state = updateState(step, state, terrain, agent_buffer)
+        recorder = updateStateHistory(step, steps_per_frame, state, recorder)
+        step+=1
+    step = max(step, population_steps) # the populations stepped side by side with the other agents
+    elapsed = time.perf_counter() - start
+    steps_per_second = step / elapsed if elapsed > 0 else float("inf")
+    print(f"steps: {step}\tagents left: {len(agent_buffer)}\ttime: {elapsed:.2f}s\tsteps/s: {steps_per_second:.1f}")
 
+    tools.writeStateToImage(output_image_path, state)
+    recorder.save()
+    print(f"Saved {output_image_path} {output_video_path}")
 
+# CANVAS_H, CANVAS_W = 720, 1280 # overwritten when an image is loaded
+#@profile # for profiling, uncomment this line and run: python -m memory_profiler generator.py
+def main():
+    args = parseArgs()
+    rng = np.random.default_rng(args.seed)
+    if args.headless:
+        runHeadless(args.max_steps, args.output, rng, args.processes)
+        return
+    print("Loading...")
+    steps_per_frame = 1 # steps per video frame
+    max_fps = 60 # the simulation runs on its own thread, this only caps the drawing
+    state, terrain, agent_buffer = setup(rng)
 
-    original_image = state.copy()
     CANVAS_H, CANVAS_W, _ = state.shape
     pygame.init()
     pygame.font.init()
     myfont = pygame.font.SysFont('arial', 16)
     screen = pygame.display.set_mode((CANVAS_W, CANVAS_H))
+    display = Display(screen)
+    for agent in agent_buffer:
+        agent.dirty = display.dirty
     print("Loading complete.")
     #h, w = 79, 79
 
     #boxels = initBoxelsRandom(CANVAS_H, CANVAS_W)
-    state_history = [state]
-    agent_buffer:List[agents.Agent] = []
-    agents.VectorFieldVisualizerFactory(terrain, agent_buffer, 30)
-    #agents.VectorFieldWalkerFactory_1(terrain, agent_buffer, 10)
-    #agents.VectorFieldWalkerFactory_2(terrain, agent_buffer, 100)
-    agents.VectorFieldWalkerFactory_3(terrain, agent_buffer, 30)
-    print(f"agents: {len(agent_buffer)}")
+    output_image_path, output_video_path = getOutputPaths(args.output)
+    recorder = VideoRecorder(output_video_path)
+    recorder.record(state)
 
+    display.draw(state)
+    #print_boxel_energy(boxels)
 
+    def addAtMouse(mouse_pos:Tuple[int, int]) -> None:
+        # sent to the simulation thread, which owns the agent buffer
+        y, x = mouse_pos
+        v = agents.VectorFieldStroke(agent_buffer, mouse_pos[::-1], 10, terrain[x][y])
+        v.dirty = display.dirty
+        agent_buffer.append(v)
 
-    draw(screen, state)
-    #print_boxel_energy(boxels)
+    def simulate(step:int, state:StateArray) -> StateArray:
+        state = updateState(step, state, terrain, agent_buffer)
+        updateStateHistory(step, steps_per_frame, state, recorder)
+        return state
 
     step = 0
     outer_loop = True
@@ -141,29 +230,26 @@ def main():
     while outer_loop:
         draw_loop = True
         print("Draw loop")
+        scheduler = wait.FrameScheduler(max_fps)
+        # waits for new strokes once every agent is done, instead of recording the same frame over and over
+        # the agents draw into display.dirty, which only the simulation thread uses until it stops
+        simulation = SimulationThread(state, simulate, step, idle=lambda: len(agent_buffer) == 0, dirty=display.dirty)
+        simulation.start()
         while draw_loop:
-            def addAtMouse(mouse_pos:Tuple[int, int]) -> None:
-                y, x = mouse_pos
-                v = agents.VectorFieldWalker(agent_buffer, mouse_pos[::-1], 10, terrain[x][y])
-                v_back = agents.VectorFieldBackwardWalker(agent_buffer, mouse_pos[::-1], v, 10, terrain[x][y])
-                bsh = brushes.simpleBorderPolyLine
-                v.brush = bsh
-                v_back.brush = bsh
-                agent_buffer.append(v)
-                agent_buffer.append(v_back)
-            outer_loop, draw_loop = handleEvents(pygame, mouseCallback=addAtMouse)
-            state = updateState(step, state, terrain, agent_buffer)
-            state_history = updateStateHistory(step, steps_per_frame, state, state_history)
-            if step % steps_per_frame == 0:
-                draw(screen, state)
+            outer_loop, draw_loop = handleEvents(pygame, mouseCallback=lambda mouse_pos: simulation.send(addAtMouse, mouse_pos))
+            scheduler.startFrame()
+            scheduler.countSteps(simulation.drawFrame(display))
+            scheduler.endFrame()
             # if step % 10000 == 0:
             #     print()
             #     for c in agent_buffer:
             #         c.print()
                 #print_boxel_energy(boxels)
                 #print(cursor.curr_age)
-            step+=1
             #time.sleep(0.01)
+        state = simulation.stop()
+        step = simulation.step
+        display.draw(state) # the steps since the last drawn frame, stop() puts an undrawn frame's rects back
         if not outer_loop:
             break
         erode_loop = False
@@ -174,15 +260,12 @@ def main():
             if waiter.checkDone():
                 state = cv2.blur(state,(5,5))
                 state = tools.erode(2, state)
-                state_history = updateStateHistory(step, steps_per_frame, state, state_history)
-                draw(screen, state)
+                recorder = updateStateHistory(step, steps_per_frame, state, recorder)
+                display.draw(state, full=True) # blur and erode change every pixel
                 step+=1
     #
     # Exit loop. Save image
     #
-    timestamp = int(datetime.datetime.now().timestamp())
-    output_image_path = f"output/time{timestamp}.png"
-    output_video_path = f"output/time{timestamp}.avi"
     textsurface = myfont.render('Ended.', False, (255, 100, 0))
     screen.blit(textsurface,(0,0))
     textsurface = myfont.render('Press `s` to save image + video.', False, (255, 100, 0), (0,0,0))
@@ -199,12 +282,16 @@ def main():
     while save_loop:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                recorder.discard()
                 sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.unicode == 's':
                     tools.writeStateToImage(output_image_path, state)
-                    tools.writeStateHistoryToVideo(output_video_path, state_history)
+                    recorder.save()
+                else:
+                    recorder.discard()
                 save_loop = False
     return
 
-main()
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
-import time, random
+import time, argparse
+import numpy as np
 from collections import deque
 from typing import List, Callable, Any, Tuple
 from colored import fg, bg, attr
@@ -12,10 +13,11 @@ Boxels determine where the cursor goes next
 greys = ["grey_3", "grey_7","grey_11","grey_15","grey_19","grey_23","grey_27","grey_30","grey_35","grey_39","grey_42","grey_46","grey_50","grey_54","grey_58","grey_62","grey_66","grey_70","grey_74","grey_78","grey_82","grey_85","grey_89", "grey_93"]
 
 class Boxel:
-    def __init__(self, color_val_range=255):
+    def __init__(self, rng:np.random.Generator, color_val_range=255):
+        self.rng = rng
         self.cursor_next_position:Tuple[int,int] = (0,0)
         self.set_cursor_next_position()
-        self.cursor_next_color = random.randrange(color_val_range)
+        self.cursor_next_color = int(rng.integers(color_val_range))
 
         self.max_energy = 99
         self.energy = 99
@@ -35,7 +37,7 @@ class Boxel:
             (1, 0), # east
             (1, -1) # ne
         ]
-        index = random.randrange(len(positions))
+        index = int(self.rng.integers(len(positions)))
         self.cursor_next_position = positions[index]
 
     def isDead(self):
@@ -49,20 +51,30 @@ class Boxel:
         if self.energy > 0:
             self.energy -= self.cost
 
-    def visit(self, curr_step:int) -> None:
-        # calculate the energy that accumulated over the steps since last visited.
+    def energyAt(self, curr_step:int) -> int:
+        """
+        The energy including what regenerated since the last visit, so energize does not have to be called on every boxel every step.
+        Dead boxels do not regenerate.
+        """
+        if self.isDead():
+            return self.energy
         steps_since_last_visit = curr_step - self.last_step_visited
-        potential_energy = self.energy + (self.regeneration_rate * steps_since_last_visit)
-        self.energy = min(self.max_energy, self.energy)
+        return min(self.max_energy, self.energy + (self.regeneration_rate * steps_since_last_visit))
+
+    def visit(self, curr_step:int) -> None:
+        # catch up on the energy that accumulated over the steps since last visited.
+        self.energy = self.energyAt(curr_step)
+        self.last_step_visited = curr_step
         # de-energize for this step
         self.deenergize()
 
 
 class Cursor:
-    def __init__(self, h:int, w:int):
+    def __init__(self, h:int, w:int, rng:np.random.Generator):
+        self.rng = rng
         self.size = (h, w)
-        self.pos = (random.randrange(w), random.randrange(h))
-        self.col = random.randrange(MAX_VAL)
+        self.pos = (int(rng.integers(w)), int(rng.integers(h)))
+        self.col = int(rng.integers(MAX_VAL))
 
         self.lifespan = 50000
         self.curr_age = 0
@@ -71,8 +83,8 @@ class Cursor:
     def age(self, step:int) -> None:
         self.curr_age += self.aging_rate
         if self.curr_age >= self.lifespan:
-            self.pos = (random.randrange(self.size[1]), random.randrange(self.size[0]))
-            self.col = random.randrange(MAX_VAL)
+            self.pos = (int(self.rng.integers(self.size[1])), int(self.rng.integers(self.size[0])))
+            self.col = int(self.rng.integers(MAX_VAL))
             self.curr_age = 0
             self.aging_rate -= max(1, self.aging_rate -1)
 
@@ -124,11 +136,11 @@ def updateCursor(step:int, boxels:BoxelArray, cursor:Cursor) -> Cursor:
     cursor.age(step)
     return cursor
 
-def updateBoxels(step:int, boxels:BoxelArray, cursor:Cursor) -> BoxelArray:
+def updateBoxels(step:int, boxels:BoxelArray, cursor:Cursor, rng:np.random.Generator) -> BoxelArray:
     cx, cy = cursor.pos
     boxels[cy][cx].visit(step)
     if boxels[cy][cx].isDead():
-        boxels[cy][cx] = Boxel()
+        boxels[cy][cx] = Boxel(rng)
     # for x, row in enumerate(boxels):
     #     for y, b in enumerate(row):
     #         b.energize()
@@ -152,28 +164,36 @@ def initState(h:int, w:int, val_generator:Callable[[], int]) -> StateArray:
             out[x].append(val_generator())
     return out
 
-def boxelGenerator() -> Boxel:
-    return Boxel(color_val_range=MAX_VAL)
+def boxelGenerator(rng:np.random.Generator) -> Callable[[], Boxel]:
+    return lambda: Boxel(rng, color_val_range=MAX_VAL)
 
 def stateGenerator() -> int:
     return 0
 
 
 MAX_VAL = 23 # 23 because there are 23 grey colours to display
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="V2 - a cursor draws the picture")
+    parser.add_argument("--seed", type=int, default=None,
+            help="Seed for every random choice. Runs with the same seed produce identical output.")
+    return parser.parse_args()
+
 CANVAS_H, CANVAS_W = 100, 100
 def main():
+    args = parseArgs()
+    rng = np.random.default_rng(args.seed)
     #h, w = 79, 79
 
-    boxels = initBoxels(CANVAS_H, CANVAS_W, boxelGenerator)
+    boxels = initBoxels(CANVAS_H, CANVAS_W, boxelGenerator(rng))
     state = initState(CANVAS_H, CANVAS_W, stateGenerator)
-    cursor = Cursor(CANVAS_H, CANVAS_W)
+    cursor = Cursor(CANVAS_H, CANVAS_W, rng)
     print_state_colors(state)
     #print_boxel_energy(boxels)
     step = 0
     while True:
         state = updateState(state, cursor)
         cursor = updateCursor(step, boxels, cursor)
-        boxels = updateBoxels(step, boxels, cursor)
+        boxels = updateBoxels(step, boxels, cursor, rng)
         if step % 500 == 0:
             print_state_colors(state)
             #print_boxel_energy(boxels)
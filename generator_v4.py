@@ -1,7 +1,7 @@
 import pygame
 from pygame.locals import *
 import numpy as np
-import time, random, sys
+import time, sys, argparse
 from collections import deque
 from typing import List, Callable, Any, Tuple
 from colored import fg, bg, attr
@@ -16,20 +16,21 @@ Optimize boxel updating.
 greys = ["grey_3", "grey_7","grey_11","grey_15","grey_19","grey_23","grey_27","grey_30","grey_35","grey_39","grey_42","grey_46","grey_50","grey_54","grey_58","grey_62","grey_66","grey_70","grey_74","grey_78","grey_82","grey_85","grey_89", "grey_93"]
 
 class Cursor:
-    def __init__(self, h:int, w:int):
+    def __init__(self, h:int, w:int, rng:np.random.Generator):
+        self.rng = rng
         self.size = (w, h)
-        self.pos = (random.randrange(w), random.randrange(h))
+        self.pos = (int(rng.integers(w)), int(rng.integers(h)))
         self.previous_pos = (self.pos[0]-1, self.pos[1]-1)
         self.color = 10#MAX_VAL#random.randrange(MAX_VAL)
 
         self.lifespan = 50000
-        self.curr_age = random.randrange(25000)
+        self.curr_age = int(rng.integers(25000))
         self.aging_rate = 1000
 
     def age(self, step:int) -> None:
         self.curr_age += self.aging_rate
         if self.curr_age >= self.lifespan:
-            self.pos = (random.randrange(self.size[0]), random.randrange(self.size[1]))
+            self.pos = (int(self.rng.integers(self.size[0])), int(self.rng.integers(self.size[1])))
             #self.color += int(step/50000)
             self.curr_age = 0
             self.aging_rate = max(1, int(self.aging_rate*0.99))
@@ -42,13 +43,14 @@ class Cursor:
         print(f"Cursor: Age:{self.curr_age}\tpos: {self.pos}\tage_rate:{self.aging_rate}")
 
 class Boxel:
-    def __init__(self, color_val_range=255):
+    def __init__(self, rng:np.random.Generator, color_val_range=255):
+        self.rng = rng
         # self.cursor_next_position:Tuple[int,int] = (0,0)
         # self.set_cursor_next_position()
         self.cursor_movement_mode = self.mode1
         self.setCursorMovementMode()
         self.mode1_index:int = -1
-        self.cursor_next_color = random.randrange(color_val_range)
+        self.cursor_next_color = int(rng.integers(color_val_range))
 
         self.max_energy = 99
         self.energy = 99
@@ -76,7 +78,7 @@ class Boxel:
             self.mode1,
             self.mode2
         ]
-        self.cursor_movement_mode = random.choice(modes)
+        self.cursor_movement_mode = modes[self.rng.integers(len(modes))]
 
     def getCursorNextPosition(self, cursor:Cursor) -> Tuple[int,int]:
         return self.cursor_movement_mode(cursor)
@@ -93,7 +95,7 @@ class Boxel:
                 (1, -1) # ne
             ]
         if self.mode1_index == -1:
-            self.mode1_index = random.randrange(len(positions))
+            self.mode1_index = int(self.rng.integers(len(positions)))
         return positions[self.mode1_index]
 
     def mode2(self, cursor:Cursor) -> Tuple[int,int]:
@@ -110,11 +112,20 @@ class Boxel:
         if self.energy > 0:
             self.energy -= self.cost
 
-    def visit(self, curr_step:int) -> None:
-        # calculate the energy that accumulated over the steps since last visited.
+    def energyAt(self, curr_step:int) -> int:
+        """
+        The energy including what regenerated since the last visit, so energize does not have to be called on every boxel every step.
+        Dead boxels do not regenerate.
+        """
+        if self.isDead():
+            return self.energy
         steps_since_last_visit = curr_step - self.last_step_visited
-        potential_energy = self.energy + (self.regeneration_rate * steps_since_last_visit)
-        self.energy = min(self.max_energy, self.energy)
+        return min(self.max_energy, self.energy + (self.regeneration_rate * steps_since_last_visit))
+
+    def visit(self, curr_step:int) -> None:
+        # catch up on the energy that accumulated over the steps since last visited.
+        self.energy = self.energyAt(curr_step)
+        self.last_step_visited = curr_step
         # de-energize for this step
         self.deenergize()
 
@@ -181,13 +192,13 @@ def updateCursors(step:int, boxels:BoxelArray, cursors:List[Cursor]) -> List[Cur
             pass
     return cursors
 
-def updateBoxels(step:int, boxels:BoxelArray, cursors:List[Cursor]) -> BoxelArray:
+def updateBoxels(step:int, boxels:BoxelArray, cursors:List[Cursor], rng:np.random.Generator) -> BoxelArray:
     for cursor in cursors:
         x, y = cursor.pos
         try:
             boxels[y][x].visit(step)
             if boxels[y][x].isDead():
-                boxels[y][x] = Boxel()
+                boxels[y][x] = Boxel(rng)
         except IndexError as e:
             print(e)
             print(f"INDEX ERROR: boxels[{y}][{x}]")
@@ -210,25 +221,33 @@ def initState(h:int, w:int) -> StateArray:
     print(f"state: {state.shape}")
     return state
 
-def boxelGenerator() -> Boxel:
-    return Boxel(color_val_range=MAX_VAL)
+def boxelGenerator(rng:np.random.Generator) -> Callable[[], Boxel]:
+    return lambda: Boxel(rng, color_val_range=MAX_VAL)
+
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="V4 - cursors draw the picture in a pygame window")
+    parser.add_argument("--seed", type=int, default=None,
+            help="Seed for every random choice. Runs with the same seed produce identical frames.")
+    return parser.parse_args()
 
 
 MAX_VAL = 255
 CANVAS_H, CANVAS_W = 640, 480
 def main():
+    args = parseArgs()
+    rng = np.random.default_rng(args.seed)
     pygame.init()
     screen = pygame.display.set_mode((CANVAS_W, CANVAS_H))
     #h, w = 79, 79
 
-    boxels = initBoxels(CANVAS_H, CANVAS_W, boxelGenerator)
+    boxels = initBoxels(CANVAS_H, CANVAS_W, boxelGenerator(rng))
     state = initState(CANVAS_H, CANVAS_W)
     cursors = [
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W)
+        Cursor(CANVAS_H, CANVAS_W, rng),
+        Cursor(CANVAS_H, CANVAS_W, rng),
+        Cursor(CANVAS_H, CANVAS_W, rng),
+        Cursor(CANVAS_H, CANVAS_W, rng),
+        Cursor(CANVAS_H, CANVAS_W, rng)
     ]
     draw(screen, state)
     #print_boxel_energy(boxels)
@@ -239,7 +258,7 @@ def main():
                 sys.exit()
         state = updateState(step, state, cursors)
         cursors = updateCursors(step, boxels, cursors)
-        boxels = updateBoxels(step, boxels, cursors)
+        boxels = updateBoxels(step, boxels, cursors, rng)
         if step % 500 == 0:
             draw(screen, state)
         # if step % 10000 == 0:
@@ -2,7 +2,7 @@ import pygame
 from pygame.locals import *
 import numpy as np
 from PIL import Image
-import datetime, time, random, sys
+import datetime, time, sys, argparse
 from collections import deque
 from typing import List, Callable, Any, Tuple
 from colored import fg, bg, attr
@@ -19,22 +19,23 @@ boxel direction based on pixel neighbour colour similarity.
 greys = ["grey_3", "grey_7","grey_11","grey_15","grey_19","grey_23","grey_27","grey_30","grey_35","grey_39","grey_42","grey_46","grey_50","grey_54","grey_58","grey_62","grey_66","grey_70","grey_74","grey_78","grey_82","grey_85","grey_89", "grey_93"]
 
 class Cursor:
-    def __init__(self, h:int, w:int):
+    def __init__(self, h:int, w:int, rng:np.random.Generator):
+        self.rng = rng
         self.size = (w, h)
-        self.pos = (random.randrange(w), random.randrange(h))
+        self.pos = (int(rng.integers(w)), int(rng.integers(h)))
         self.previous_pos = (self.pos[0]-1, self.pos[1]-1)
         self.color = [255, 255, 255]#MAX_VAL#random.randrange(MAX_VAL)
 
         self.lifespan = 50000
-        self.curr_age = random.randrange(25000)
+        self.curr_age = int(rng.integers(25000))
         self.aging_rate = 1000
 
-    def age(self, step:int, boxel:'Boxel') -> None:
+    def age(self, step:int, boxel_color:np.ndarray) -> None:
         self.curr_age += self.aging_rate
-        #self.color = boxel.color
+        #self.color = boxel_color
         if self.curr_age >= self.lifespan:
-            self.pos = (random.randrange(self.size[0]), random.randrange(self.size[1]))
-            self.color = boxel.color
+            self.pos = (int(self.rng.integers(self.size[0])), int(self.rng.integers(self.size[1])))
+            self.color = boxel_color.copy()
             self.curr_age = 0
             #self.aging_rate = max(1, int(self.aging_rate*0.99))
 
@@ -45,122 +46,161 @@ class Cursor:
     def print(self) -> None:
         print(f"Cursor: Age:{self.curr_age}\tpos: {self.pos}\tage_rate:{self.aging_rate}")
 
-class Boxel:
-    def __init__(self, color_val_range=255, mode=-1):
-        self.color = [255,255,255]
-        # self.cursor_next_position:Tuple[int,int] = (0,0)
-        # self.set_cursor_next_position()
-        self.cursor_movement_mode = self.mode1
-        self.setCursorMovementMode(mode)
-        self.mode0_index:int = -1
-        self.mode1_position = (0,0)
-        self.cursor_next_color = random.randrange(color_val_range)
-
-        self.max_energy = 99
-        self.energy = 99
-        self.cost = 50
-        self.regeneration_rate = 1
-
-        self.last_step_visited = 0
-    #
-    # def set_cursor_next_position(self) -> None:
-    #     positions = [
-    #         (0, -1), # north
-    #         (-1, -1),# nw
-    #         (-1, 0), # west
-    #         #(-1, 1), # sw
-    #         #(0, 1), # south
-    #         #(1, 1), # se
-    #         (1, 0), # east
-    #         (1, -1) # ne
-    #     ]
-    #     index = random.randrange(len(positions))
-    #     self.cursor_next_position = positions[index]
-
-    def setCursorMovementMode(self, mode = -1):
-        modes = [
-            self.mode0,
-            self.mode1
-        ]
-        if mode == -1:
-            self.cursor_movement_mode = random.choice(modes)
-        else:
-            self.cursor_movement_mode = modes[mode]
-
-    def getCursorNextPosition(self, cursor:Cursor) -> Tuple[int,int]:
-        return self.cursor_movement_mode(cursor)
-
-    def mode0(self, cursor:Cursor) -> Tuple[int,int]:
-        positions = [
-                (0, -1), # north
-                (-1, -1),# nw
-                (-1, 0), # west
-                (-1, 1), # sw
-                (0, 1), # south
-                (1, 1), # se
-                (1, 0), # east
-                (1, -1) # ne
-            ]
-        if self.mode0_index == -1:
-            self.mode0_index = random.randrange(len(positions))
-        return positions[self.mode0_index]
-
-    def mode1(self, cursor:Cursor) -> Tuple[int,int]:
-        return self.mode1_position
-
-    def setMode1Position(self, x:int, y:int, img_arr:Any) -> None:
-        best_match_d_x = 0
-        best_match_d_y = 0
-        best_match = 500
-        # avg similarity
-        # my_val = sum(img_arr[x][y])/len(img_arr[x][y])
-        # hue similarity (ensure load_image uses 'HSV' color_space)
-        my_val = img_arr[x][y][0]
-        for d_y in range(-1, 2):
-            for d_x in range(-1, 2):
-                # d_y and d_x are the relative coords of neighbouring pixels
-                if d_x == 0 and d_y == 0: # skip the center point
-                    continue
-                # abs_y and abs_x are the absolute coords of neighbouring pixels
-                abs_y = y+d_y
-                abs_x = x+d_x
-                if abs_y < 0 or abs_x < 0 or abs_y >= len(img_arr) or abs_x >= len(img_arr[0]): # skip edges
-                    continue
-                # avg similarity
-                # new_val = sum(img_arr[abs_y][abs_x])/len(img_arr[abs_y][abs_x])
-                # hue similarity
-                new_val = img_arr[abs_y][abs_x][0]
-                curr_sim = abs(my_val - new_val)
-                if curr_sim < best_match:
-                    best_match = curr_sim
-                    best_match_d_x = d_x
-                    best_match_d_y = d_y
-        self.mode1_position = (best_match_d_y, best_match_d_x)
-
-    def isDead(self):
-        return self.energy <= 0
-
-    def energize(self):
-        if not self.isDead() and self.energy < self.max_energy:
-            self.energy+=self.regeneration_rate
-
-    def deenergize(self):
-        if self.energy > 0:
-            self.energy -= self.cost
-
-    def visit(self, curr_step:int) -> None:
-        # calculate the energy that accumulated over the steps since last visited.
-        steps_since_last_visit = curr_step - self.last_step_visited
-        potential_energy = self.energy + (self.regeneration_rate * steps_since_last_visit)
-        self.energy = min(self.max_energy, self.energy)
-        # de-energize for this step
-        self.deenergize()
+class CursorBatch:
+    """
+    Many Cursors stored as arrays and stepped together, so thousands of them are as cheap as a few.
+    pos[i] is the (col, row) position of cursor i, like Cursor.pos.
+    """
+    def __init__(self, count:int, h:int, w:int, rng:np.random.Generator):
+        self.rng = rng
+        self.size = np.array((w, h))
+        self.pos = np.stack((rng.integers(w, size=count), rng.integers(h, size=count)), axis=1)
+        self.previous_pos = self.pos - 1
+        self.color = np.full((count, 3), 255, dtype=np.uint8)
 
+        self.lifespan = 50000
+        self.curr_age = rng.integers(25000, size=count)
+        self.aging_rate = 1000
+
+    def __len__(self) -> int:
+        return len(self.pos)
 
+class BoxelField:
+    """
+    Every boxel of the canvas stored as numpy arrays indexed [row][col], instead of one Boxel object per pixel.
+
+    next_offset is the (col, row) offset a cursor on the boxel moves by, the same order as Cursor.pos:
+    mode 0 boxels move in one random direction, mode 1 boxels towards the neighbour with the closest hue.
+    """
+    # what a new boxel starts with
+    NEW_MAX_ENERGY = 99
+    NEW_COST = 50
+    NEW_REGENERATION_RATE = 1
+    # mode 0 directions, (col, row) offsets
+    MODE0_OFFSETS = np.array([
+            (0, -1), # north
+            (-1, -1),# nw
+            (-1, 0), # west
+            (-1, 1), # sw
+            (0, 1), # south
+            (1, 1), # se
+            (1, 0), # east
+            (1, -1) # ne
+        ], dtype=np.int8)
+
+    def __init__(self, h:int, w:int, rng:np.random.Generator, color_val_range:int=255, mode:int=-1):
+        self.rng = rng
+        self.color = np.full((h, w, 3), 255, dtype=np.uint8)
+        if mode == -1:
+            self.mode = rng.integers(2, size=(h, w), dtype=np.uint8)
+        else:
+            self.mode = np.full((h, w), mode, dtype=np.uint8)
+        self.next_offset = np.zeros((h, w, 2), dtype=np.int8)
+        mode0 = self.mode == 0
+        self.next_offset[mode0] = self.MODE0_OFFSETS[rng.integers(len(self.MODE0_OFFSETS), size=int(mode0.sum()))]
+        self.cursor_next_color = rng.integers(color_val_range, size=(h, w), dtype=np.int32)
+        self.color_val_range = color_val_range
+
+        self.max_energy = np.full((h, w), self.NEW_MAX_ENERGY, dtype=np.int32)
+        self.energy = np.full((h, w), self.NEW_MAX_ENERGY, dtype=np.int32)
+        self.cost = np.full((h, w), self.NEW_COST, dtype=np.int32)
+        self.regeneration_rate = np.full((h, w), self.NEW_REGENERATION_RATE, dtype=np.int32)
+
+        self.last_step_visited = np.zeros((h, w), dtype=np.int64)
+
+    def setMode1Offsets(self, img_arr:np.ndarray) -> None:
+        """
+        Points every mode 1 boxel at its neighbour with the closest hue, for the whole image at once.
+        Ties go to the first neighbour in (col offset, row offset) order, like the per pixel loop did.
+        Neighbours outside the image are skipped.
+        """
+        h, w = img_arr.shape[:2]
+        # hue similarity (ensure load_image uses 'HSV' color_space). Signed, so the differences do not wrap around.
+        hue = img_arr[..., 0].astype(np.int16)
+        padded = np.pad(hue, 1, constant_values=0)
+        outside = np.pad(np.zeros((h, w), dtype=bool), 1, constant_values=True)
+        offsets = [(d_y, d_x) for d_y in range(-1, 2) for d_x in range(-1, 2) if d_x != 0 or d_y != 0]
+        diffs = np.empty((len(offsets), h, w), dtype=np.int16)
+        for i, (d_col, d_row) in enumerate(offsets):
+            window = (slice(1 + d_row, 1 + d_row + h), slice(1 + d_col, 1 + d_col + w))
+            diffs[i] = np.abs(hue - padded[window])
+            diffs[i][outside[window]] = np.iinfo(np.int16).max
+        best = np.argmin(diffs, axis=0)
+        mode1 = self.mode == 1
+        self.next_offset[mode1] = np.array(offsets, dtype=np.int8)[best[mode1]]
+
+    def isDead(self, row:int, col:int) -> bool:
+        return self.energy[row, col] <= 0
+
+    def energyAt(self, curr_step:int, rows:Any=None, cols:Any=None) -> Any:
+        """
+        The energy including what regenerated since the last visit, so nothing has to be updated on every boxel every step.
+        Dead boxels do not regenerate.
+        rows, cols: the boxels to look at, indices or index arrays. Defaults to the whole grid.
+        """
+        if rows is None:
+            rows, cols = slice(None), slice(None)
+        energy = self.energy[rows, cols]
+        steps_since_last_visit = curr_step - self.last_step_visited[rows, cols]
+        regenerated = np.minimum(self.max_energy[rows, cols], energy + self.regeneration_rate[rows, cols] * steps_since_last_visit)
+        return np.where(energy > 0, regenerated, energy)
+
+    def visit(self, curr_step:int, row:int, col:int) -> None:
+        # catch up on the energy that accumulated over the steps since last visited.
+        self.energy[row, col] = self.energyAt(curr_step, row, col)
+        self.last_step_visited[row, col] = curr_step
+        # de-energize for this step
+        if self.energy[row, col] > 0:
+            self.energy[row, col] -= self.cost[row, col]
+
+    def visitMany(self, curr_step:int, rows:np.ndarray, cols:np.ndarray) -> None:
+        """
+        One visit per (row, col) pair, respawning the boxels that die, like calling visit then
+        isDead and respawn for each pair in turn. A boxel visited k times this step ends up as if visited k times in a row.
+        """
+        h, w = self.energy.shape
+        cells, visits = np.unique(rows * w + cols, return_counts=True)
+        rows, cols = np.divmod(cells, w)
+        # only the first visit regenerates, the rest come in the same step
+        energy = self.energyAt(curr_step, rows, cols)
+        cost = self.cost[rows, cols]
+        # visits it takes to use up the energy. Each visit takes 'cost' while there is energy left.
+        to_dead = np.where(energy > 0, -(-energy // np.maximum(cost, 1)), 1)
+        survives = visits < to_dead
+        self.energy[rows[survives], cols[survives]] = energy[survives] - visits[survives] * cost[survives]
+        self.last_step_visited[rows[survives], cols[survives]] = curr_step
+        # the rest died at least once. The visits after the first death go to new boxels, which die every new_to_dead visits.
+        dies = ~survives
+        rows, cols = rows[dies], cols[dies]
+        self.respawnMany(rows, cols)
+        new_to_dead = -(-self.NEW_MAX_ENERGY // self.NEW_COST)
+        later_visits = (visits[dies] - to_dead[dies]) % new_to_dead
+        self.energy[rows, cols] = self.NEW_MAX_ENERGY - later_visits * self.NEW_COST
+        visited = later_visits > 0
+        self.last_step_visited[rows[visited], cols[visited]] = curr_step
+
+    def respawn(self, row:int, col:int) -> None:
+        """ Replaces the boxel with a new random one that keeps its colour """
+        self.respawnMany(np.array([row]), np.array([col]))
+
+    def respawnMany(self, rows:np.ndarray, cols:np.ndarray) -> None:
+        count = len(rows)
+        mode = self.rng.integers(2, size=count, dtype=np.uint8)
+        self.mode[rows, cols] = mode
+        offsets = np.zeros((count, 2), dtype=np.int8) # a new mode 1 boxel has no neighbour picked
+        mode0 = mode == 0
+        offsets[mode0] = self.MODE0_OFFSETS[self.rng.integers(len(self.MODE0_OFFSETS), size=int(mode0.sum()))]
+        self.next_offset[rows, cols] = offsets
+        self.cursor_next_color[rows, cols] = self.rng.integers(self.color_val_range, size=count)
+        self.max_energy[rows, cols] = self.NEW_MAX_ENERGY
+        self.energy[rows, cols] = self.NEW_MAX_ENERGY
+        self.cost[rows, cols] = self.NEW_COST
+        self.regeneration_rate[rows, cols] = self.NEW_REGENERATION_RATE
+        self.last_step_visited[rows, cols] = 0
 
 
 # types
-BoxelArray = List[List[Boxel]]
+BoxelArray = BoxelField
 StateArray = Any
 ImageArray = Any
 
@@ -179,10 +219,10 @@ def print_boxel_energy(boxels:BoxelArray) -> None:
     out = ""
     #out = clear_screen()
     out += move_cursor(CANVAS_H,0)
-    for row in boxels:
-        for bxl in row:
-            #out += fg(greys[bxl.energy*4])+"██"
-            out += f"{bxl.energy} "
+    for row in boxels.energy:
+        for energy in row:
+            #out += fg(greys[energy*4])+"██"
+            out += f"{energy} "
         out+="\n"
     print(out, attr('reset'))
 
@@ -202,6 +242,11 @@ def updateState(step:int, state:StateArray, cursors: List[Cursor]) -> StateArray
         state[x, y] = cursor.color
     return state
 
+def updateStateBatch(step:int, state:StateArray, cursors:CursorBatch) -> StateArray:
+    # where cursors share a pixel the last one's colour is kept, like the loop in updateState
+    state[cursors.pos[:, 0], cursors.pos[:, 1]] = cursors.color
+    return state
+
 def updateStateHistory(step:int, state:StateArray, state_history:List[StateArray]) -> List[StateArray]:
     if step % 200 == 0:
         state_history.append(state.copy())
@@ -210,58 +255,50 @@ def updateStateHistory(step:int, state:StateArray, state_history:List[StateArray
 
 def updateCursors(step:int, boxels:BoxelArray, cursors:List[Cursor]) -> List[Cursor]:
     for cursor in cursors:
-        try:
-            x, y = cursor.pos
-            b = boxels[y][x]
-            new_pos = b.getCursorNextPosition(cursor)
-            new_x = (cursor.pos[0] + new_pos[0]) % cursor.size[0]
-            new_y = (cursor.pos[1] + new_pos[1]) % cursor.size[1]
-            cursor.updatePosition((new_x, new_y))
-            #cursor.color = (cursor.color + b.cursor_next_color) % MAX_VAL
-            cursor.age(step, b)
-        except IndexError as e:
-            print(e)
-            print(f"INDEX ERROR: boxels[{x}][{y}]")
-            print(len(boxels))
-            print(len(boxels[y]))
-            pass
+        x, y = cursor.pos
+        new_pos = boxels.next_offset[y, x]
+        new_x = (cursor.pos[0] + int(new_pos[0])) % cursor.size[0]
+        new_y = (cursor.pos[1] + int(new_pos[1])) % cursor.size[1]
+        cursor.updatePosition((new_x, new_y))
+        #cursor.color = (cursor.color + boxels.cursor_next_color[y, x]) % MAX_VAL
+        cursor.age(step, boxels.color[y, x])
     return cursors
 
-def updateBoxels(step:int, boxels:BoxelArray, cursors:List[Cursor]) -> BoxelArray:
+def updateBoxels(step:int, boxels:BoxelArray, cursors:List[Cursor], rng:np.random.Generator) -> BoxelArray:
     for cursor in cursors:
         x, y = cursor.pos
-        try:
-            boxels[y][x].visit(step)
-            if boxels[y][x].isDead():
-                retain_color = boxels[y][x].color
-                boxels[y][x] = Boxel()
-                boxels[y][x].color = retain_color
-        except IndexError as e:
-            print(e)
-            print(f"INDEX ERROR: boxels[{y}][{x}]")
-            print(len(boxels))
-            #print(len(boxels[y]))
-            pass
+        boxels.visit(step, y, x)
+        if boxels.isDead(y, x):
+            boxels.respawn(y, x)
+    return boxels
+
+def updateCursorBatch(step:int, boxels:BoxelArray, cursors:CursorBatch) -> CursorBatch:
+    """ updateCursors for every cursor of the batch at once """
+    x, y = cursors.pos[:, 0], cursors.pos[:, 1]
+    boxel_color = boxels.color[y, x]
+    cursors.previous_pos = cursors.pos
+    cursors.pos = (cursors.pos + boxels.next_offset[y, x]) % cursors.size
+    cursors.curr_age += cursors.aging_rate
+    old = cursors.curr_age >= cursors.lifespan
+    count = int(old.sum())
+    cursors.pos[old] = np.stack((cursors.rng.integers(cursors.size[0], size=count), cursors.rng.integers(cursors.size[1], size=count)), axis=1)
+    cursors.color[old] = boxel_color[old]
+    cursors.curr_age[old] = 0
+    return cursors
+
+def updateBoxelsBatch(step:int, boxels:BoxelArray, cursors:CursorBatch) -> BoxelArray:
+    boxels.visitMany(step, cursors.pos[:, 1], cursors.pos[:, 0])
     return boxels
 
-def initBoxelsRandom(h:int, w:int) -> BoxelArray:
-    out:BoxelArray = []
-    for x in range(0, h):
-        out.append([])
-        for y in range(0, w):
-            out[x].append(Boxel(color_val_range=MAX_VAL))
-    print(f"boxels:{len(out)}, {len(out[-1])}")
+def initBoxelsRandom(h:int, w:int, rng:np.random.Generator) -> BoxelArray:
+    out = BoxelField(h, w, rng, color_val_range=MAX_VAL)
+    print(f"boxels:{h}, {w}")
     return out
 
-def initBoxelsFromImage(image:ImageArray)-> BoxelArray:
-    out:BoxelArray = []
-    for x in range(0, image.shape[0]):
-        out.append([])
-        for y in range(0, image.shape[1]):
-            b = Boxel(color_val_range=MAX_VAL, mode=1)
-            b.setMode1Position(x, y, image)
-            b.color = image[x][y]
-            out[x].append(b)
+def initBoxelsFromImage(image:ImageArray, rng:np.random.Generator)-> BoxelArray:
+    out = BoxelField(image.shape[0], image.shape[1], rng, color_val_range=MAX_VAL, mode=1)
+    out.setMode1Offsets(image)
+    out.color[:] = image[..., :3]
     return out
 
 
@@ -272,15 +309,25 @@ def initState(h:int, w:int) -> StateArray:
 
 MAX_VAL = 255
 
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="V5 - cursors walk the image")
+    parser.add_argument("--seed", type=int, default=None,
+            help="Seed for every random choice. Runs with the same seed and config produce identical frames.")
+    return parser.parse_args()
+
 CANVAS_H, CANVAS_W = 720, 1280 # overwritten when an image is loaded
 def main():
+    args = parseArgs()
+    rng = np.random.default_rng(args.seed)
     print("Loading...")
     """
     Config
     """
     image_scale_percent = 10
+    batched = True # step all the cursors at once as a CursorBatch
+    cursor_count = 5000 # when batched
     image = tools.loadImage("img_in/G.jpeg", scale_percent=image_scale_percent)
-    boxels = initBoxelsFromImage(image)
+    boxels = initBoxelsFromImage(image, rng)
     CANVAS_H, CANVAS_W, _ = image.shape
     pygame.init()
     pygame.font.init()
@@ -289,16 +336,19 @@ def main():
     print("Loading complete.")
     #h, w = 79, 79
 
-    #boxels = initBoxelsRandom(CANVAS_H, CANVAS_W)
+    #boxels = initBoxelsRandom(CANVAS_H, CANVAS_W, rng)
     state = initState(CANVAS_H, CANVAS_W)
     state_history = [state]
-    cursors = [
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W),
-        Cursor(CANVAS_H, CANVAS_W)
-    ]
+    if batched:
+        cursor_batch = CursorBatch(cursor_count, CANVAS_H, CANVAS_W, rng)
+    else:
+        cursors = [
+            Cursor(CANVAS_H, CANVAS_W, rng),
+            Cursor(CANVAS_H, CANVAS_W, rng),
+            Cursor(CANVAS_H, CANVAS_W, rng),
+            Cursor(CANVAS_H, CANVAS_W, rng),
+            Cursor(CANVAS_H, CANVAS_W, rng)
+        ]
     draw(screen, state)
     #print_boxel_energy(boxels)
     step = 0
@@ -309,10 +359,16 @@ def main():
                 sys.exit()
             if event.type == pygame.KEYDOWN:
                 draw_loop = False
-        state = updateState(step, state, cursors)
-        state_history = updateStateHistory(step, state, state_history)
-        cursors = updateCursors(step, boxels, cursors)
-        boxels = updateBoxels(step, boxels, cursors)
+        if batched:
+            state = updateStateBatch(step, state, cursor_batch)
+            state_history = updateStateHistory(step, state, state_history)
+            cursor_batch = updateCursorBatch(step, boxels, cursor_batch)
+            boxels = updateBoxelsBatch(step, boxels, cursor_batch)
+        else:
+            state = updateState(step, state, cursors)
+            state_history = updateStateHistory(step, state, state_history)
+            cursors = updateCursors(step, boxels, cursors)
+            boxels = updateBoxels(step, boxels, cursors, rng)
         if step % 500 == 0:
             draw(screen, state)
         # if step % 10000 == 0:
@@ -352,4 +408,5 @@ def main():
                 save_loop = False
     return
 
-main()
+if __name__ == "__main__":
+    main()
@@ -3,12 +3,18 @@ from pygame.locals import *
 import numpy as np
 from PIL import Image
 import cv2
-import datetime, time, random, sys, math, traceback
+import datetime, time, sys, math, traceback, argparse
 from collections import deque
-from typing import List, Callable, Any, Tuple
+from typing import List, Callable, Any, Tuple, Optional
 
 from src import tools
+from src import agents
+from src import brushes
+from src.recorder import VideoRecorder
+from src.display import Display
+from src import cache
 from src import waiter as wait
+from src.occupancy import OccupancyGrid
 
 """
 V6 - grow crystals
@@ -24,16 +30,20 @@ V6 - grow crystals
 
 
 class Cursor:
-    def __init__(self, cursor_list:List['Cursor'], size:Tuple[int, int], spawn_rate:float=0.9, step_distance:float=10, step_direction:float=140):
+    def __init__(self, cursor_list:List['Cursor'], size:Tuple[int, int], spawn_rate:float=0.9, step_distance:float=10, step_direction:float=140, occupancy:Optional[OccupancyGrid]=None, rng:Optional[np.random.Generator]=None, dirty:Optional[brushes.DirtyRects]=None):
         self.cursor_list = cursor_list
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # see OccupancyGrid about sharing the grid
+        self.occupancy = occupancy if occupancy is not None else OccupancyGrid(size)
 
         self.size = size
         h = self.size[0]
         w = self.size[1]
-        self.pos = (random.randrange(h), random.randrange(w))
+        self.pos = (int(self.rng.integers(h)), int(self.rng.integers(w)))
         self.previous_pos = (self.pos[0]-1, self.pos[1]-1)
         self.color = [255, 255, 255]
         self.stroke_width = 1
+        self.dirty = dirty # where the lines are recorded for the display
 
         self.spawn_rate=spawn_rate
         self.step_distance=step_distance
@@ -81,24 +91,20 @@ class Cursor:
                 self.die(3)
                 return state
             # if meet an existing line
-            line_points = tools.get_line(x_1, y_1, x, y)
-            for p in line_points[1:]:
-                p_x, p_y = p
-                if p_x == self.pos[0] and p_y == self.pos[1]:
-                    continue # skip the current position
-                if state[p_x][p_y][0] == 255:
-                    self.die(4)
-                    return state
+            if self.occupancy.hitsLine(self.pos, new_pos):
+                self.die(4)
+                return state
         except IndexError as E:
             print(E)
             traceback.print_exc(file=sys.stdout)
             self.die(5)
             return state
         # Do spawn
-        if random.random() < self.spawn_rate:
+        if self.rng.random() < self.spawn_rate:
             self.spawn(state)
         # Do step
-        state = cv2.line(state,self.pos[::-1],new_pos[::-1],self.color,self.stroke_width)
+        state = brushes._line(state,self.pos[::-1],new_pos[::-1],self.color,self.stroke_width,self.dirty)
+        self.occupancy.markLine(self.pos, new_pos, self.stroke_width)
         self.previous_pos = self.pos
         self.pos = new_pos
         self.curr_age += self.aging_rate
@@ -109,14 +115,14 @@ class Cursor:
         #print(x)
 
     def spawn(self, state):
-        new_direction = self.step_direction + random.choice([30, -30])
+        new_direction = self.step_direction + (30 if self.rng.random() < 0.5 else -30)
         new_step_distance = self.step_distance*0.8
         if new_step_distance < 1:
             return
         new_spawn_rate = min(self.spawn_rate*0.8, 1.0)
         new_lifespan = int(self.lifespan * 0.9)
 
-        child = Cursor(self.cursor_list, self.size, spawn_rate=new_spawn_rate, step_distance=new_step_distance, step_direction=new_direction)
+        child = Cursor(self.cursor_list, self.size, spawn_rate=new_spawn_rate, step_distance=new_step_distance, step_direction=new_direction, occupancy=self.occupancy, rng=self.rng, dirty=self.dirty)
         child.lifespan = new_lifespan
         #child.color = [self.color[0]-1,self.color[1]-1,self.color[2]-1]
         child.pos = self.pos
@@ -129,42 +135,37 @@ class Cursor:
 StateArray = Any
 ImageArray = Any
 
-def draw(screen:pygame.surface.Surface, state:ImageArray) -> None:
-    img = state.copy()
-    # swap axes from cv2 [x][y] style to pygame [y][x] style
-    img = np.swapaxes(img, 0, 1)
-    # move BGR to RGB
-    img = img[...,::-1]
-    surface = pygame.surfarray.make_surface(img)
-    screen.blit(surface, (0, 0))
-    pygame.display.update()
-
-
-def updateState(step:int, state:StateArray, original_image:StateArray, cursors: List[Cursor]) -> StateArray:
+def updateState(step:int, state:StateArray, original_image:StateArray, cursors: List[Cursor], occupancy:OccupancyGrid, rng:np.random.Generator, dirty:Optional[brushes.DirtyRects]=None) -> StateArray:
     #print(len(cursors))
     if len(cursors) == 0:
         #cursors.append(Cursor(cursors, (state.shape[1], state.shape[0]))) # must reverse cv2 shape
-        getCrystalCursorsAroundRandomSeedPoint(state.shape[0], state.shape[1], 60, cursors)
+        getCrystalCursorsAroundRandomSeedPoint(state.shape[0], state.shape[1], 60, cursors, occupancy, rng, dirty)
 
+    # agents spawned during the step are appended and also take this step.
     for cursor in cursors:
         state = cursor.step(step, state, original_image)
-        if cursor.dead:
-            cursors.remove(cursor)
+    tools.removeDead(cursors)
     return state
 
-def updateStateHistory(step:int, every:int, state:StateArray, state_history:List[StateArray]) -> List[StateArray]:
+def updateStatePopulation(step:int, state:StateArray, original_image:StateArray, crystals:agents.FrostPopulation) -> StateArray:
+    """ updateState for the batched crystals """
+    if crystals.dead:
+        crystals.addAroundRandomSeedPoint(60)
+    return crystals.step(step, state, original_image)
+
+def updateStateHistory(step:int, every:int, state:StateArray, recorder:VideoRecorder) -> VideoRecorder:
     if step % every == 0:
-        state_history.append(state.copy())
-    return state_history
+        recorder.record(state)
+    return recorder
 
 
-def getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, angle_beween, cursors):
-    offset_angle = int(angle_beween * random.random())
-    point = (random.randrange(CANVAS_H), random.randrange(CANVAS_W))
+def getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, angle_beween, cursors, occupancy, rng, dirty=None):
+    offset_angle = int(angle_beween * rng.random())
+    point = (int(rng.integers(CANVAS_H)), int(rng.integers(CANVAS_W)))
     # point = (300, 150)
     # print(CANVAS_H, CANVAS_W)
     for theta in range(0,360,angle_beween):
-        c = Cursor(cursors, (CANVAS_H, CANVAS_W))
+        c = Cursor(cursors, (CANVAS_H, CANVAS_W), occupancy=occupancy, rng=rng, dirty=dirty)
         c.pos = point
         c.step_direction = theta+offset_angle
         cursors.append(c)
@@ -190,8 +191,16 @@ def handleEvents(pygame:Any) -> Tuple[bool, bool]:
 
 MAX_VAL = 255
 
+def parseArgs() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="V6 - grow crystals")
+    parser.add_argument("--seed", type=int, default=None,
+            help="Seed for every random choice. Runs with the same seed and config produce identical frames.")
+    return parser.parse_args()
+
 # CANVAS_H, CANVAS_W = 720, 1280 # overwritten when an image is loaded
 def main():
+    args = parseArgs()
+    rng = np.random.default_rng(args.seed)
     print("Loading...")
     """
     Config
@@ -199,37 +208,46 @@ def main():
     pygame uses (H,W)
     In this script use: (H,W) for drawing
     """
-    steps_per_frame = 1
+    steps_per_frame = 1 # steps per video frame
+    max_fps = 60 # the simulation runs as many steps as fit between drawn frames
     image_scale_percent = 15
-    state = tools.loadCVImage("img_in/g.jpeg", scale_percent=image_scale_percent)
+    batched = True # grow every crystal at once as an agents.FrostPopulation, instead of one Cursor object each
+    # loads, resizes and quantizes the image, or reuses the result of an earlier run
+    state = cache.loadQuantizedCVImage("img_in/g.jpeg", scale_percent=image_scale_percent, seed=args.seed)
     print('m', state.shape)
-
-
-    state = tools.filterCVImage_quantizeHues(state)
     original_image = state.copy()
     CANVAS_H, CANVAS_W, _ = state.shape
     pygame.init()
     pygame.font.init()
     myfont = pygame.font.SysFont('arial', 16)
     screen = pygame.display.set_mode((CANVAS_W, CANVAS_H))
+    display = Display(screen)
     print("Loading complete.")
     #h, w = 79, 79
 
     #boxels = initBoxelsRandom(CANVAS_H, CANVAS_W)
-    state_history = [state]
+    timestamp = int(datetime.datetime.now().timestamp())
+    output_image_path = f"output/time{timestamp}.png"
+    output_video_path = f"output/time{timestamp}.avi"
+    recorder = VideoRecorder(output_video_path)
+    recorder.record(state)
     cursors:List[Cursor] = []
-
-    getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, 60, cursors)
-    getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, 60, cursors)
-    getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, 60, cursors)
-    getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, 60, cursors)
+    occupancy = OccupancyGrid((CANVAS_H, CANVAS_W))
+
+    crystals = agents.FrostPopulation((CANVAS_H, CANVAS_W), occupancy, rng)
+    crystals.dirty = display.dirty
+    for _ in range(4):
+        if batched:
+            crystals.addAroundRandomSeedPoint(60)
+        else:
+            getCrystalCursorsAroundRandomSeedPoint(CANVAS_H, CANVAS_W, 60, cursors, occupancy, rng, display.dirty)
     # cursors.append(Cursor(cursors, (CANVAS_H, CANVAS_W)))
     # cursors.append(Cursor(cursors, (CANVAS_H, CANVAS_W)))
     # cursors.append(Cursor(cursors, (CANVAS_H, CANVAS_W)))
     # cursors.append(Cursor(cursors, (CANVAS_H, CANVAS_W)))
     # cursors.append(Cursor(cursors, (CANVAS_H, CANVAS_W)))
 
-    draw(screen, state)
+    display.draw(state)
     #print_boxel_energy(boxels)
     step = 0
     outer_loop = True
@@ -237,20 +255,25 @@ def main():
     while outer_loop:
         draw_loop = True
         print("Draw loop")
+        scheduler = wait.FrameScheduler(max_fps)
         while draw_loop:
             outer_loop, draw_loop = handleEvents(pygame)
-            state = updateState(step, state, original_image, cursors)
-
-            state_history = updateStateHistory(step, steps_per_frame, state, state_history)
-            if step % steps_per_frame == 0:
-                draw(screen, state)
+            scheduler.startFrame()
+            while scheduler.stepDue():
+                if batched:
+                    state = updateStatePopulation(step, state, original_image, crystals)
+                else:
+                    state = updateState(step, state, original_image, cursors, occupancy, rng, display.dirty)
+                recorder = updateStateHistory(step, steps_per_frame, state, recorder)
+                step+=1
+            display.draw(state)
+            scheduler.endFrame()
             # if step % 10000 == 0:
             #     print()
             #     for c in cursors:
             #         c.print()
                 #print_boxel_energy(boxels)
                 #print(cursor.curr_age)
-            step+=1
             #time.sleep(0.01)
         if not outer_loop:
             break
@@ -262,15 +285,12 @@ def main():
             if waiter.checkDone():
                 state = cv2.blur(state,(5,5))
                 state = tools.erode(2, state)
-                state_history = updateStateHistory(step, steps_per_frame, state, state_history)
-                draw(screen, state)
+                recorder = updateStateHistory(step, steps_per_frame, state, recorder)
+                display.draw(state, full=True) # blur and erode change every pixel
                 step+=1
     #
     # Exit loop. Save image
     #
-    timestamp = int(datetime.datetime.now().timestamp())
-    output_image_path = f"output/time{timestamp}.png"
-    output_video_path = f"output/time{timestamp}.avi"
     textsurface = myfont.render('Ended.', False, (255, 100, 0))
     screen.blit(textsurface,(0,0))
     textsurface = myfont.render('Press `s` to save image + video.', False, (255, 100, 0), (0,0,0))
@@ -287,11 +307,14 @@ def main():
     while save_loop:
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
+                recorder.discard()
                 sys.exit()
             if event.type == pygame.KEYDOWN:
                 if event.unicode == 's':
                     tools.writeStateToImage(output_image_path, state)
-                    tools.writeStateHistoryToVideo(output_video_path, state_history)
+                    recorder.save()
+                else:
+                    recorder.discard()
                 save_loop = False
     return
 
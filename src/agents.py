@@ -1,9 +1,11 @@
-import random, math, traceback, sys
+import math, traceback, sys
+from collections import deque
 import numpy as np
 import cv2
 from src import tools
 from src import brushes
-from typing import Callable, List, Tuple, Any
+from src.occupancy import OccupancyGrid, PathGrid
+from typing import Callable, Dict, List, Tuple, Any, Optional
 
 class Agent:
     def __init__(self) -> None:
@@ -24,6 +26,8 @@ class Agent:
         self.curr_age = 0
         self.aging_rate = 500
         self.brush:Callable[[np.ndarray, List[Tuple[int, int]]], np.ndarray] = brushes.simpleBorderPolyLine
+        # where the brushes record what they draw, eg. a Display's. Spawned agents share their parent's.
+        self.dirty:Optional[brushes.DirtyRects] = None
 
     def calculateNextPosition(self):
         return self.position
@@ -35,7 +39,7 @@ class Agent:
         pass
 
     def doDraw(self, state:np.ndarray) -> None:
-        state = self.brush(state, self.position_history)
+        state = self.brush(state, self.position_history, dirty=self.dirty)
 
     def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
         # 1. Calculate new position
@@ -63,6 +67,7 @@ class Agent:
         """
         vector is a (distance, direction) tuple. aka (r, θ)
         returns a cartesian (x, y) point rounded to nearest integer.
+        round() rounds half to even. The array versions use np.rint, which does the same, so they give the same steps.
         """
         x = vector[0] * math.cos(vector[1])
         y = vector[0] * math.sin(vector[1])
@@ -72,16 +77,20 @@ class Agent:
         return (p1[0]+p2[0], p1[1]+p2[1])
 
 class FrostDrawer(Agent):
-    def __init__(self, cursor_list:List[Agent], size:Tuple[int, int], spawn_rate:float=0.9, step_distance:float=10, step_direction:float=140):
+    def __init__(self, cursor_list:List[Agent], size:Tuple[int, int], spawn_rate:float=0.9, step_distance:float=10, step_direction:float=140, occupancy:Optional[OccupancyGrid]=None, rng:Optional[np.random.Generator]=None):
         self.cursor_list = cursor_list
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # see OccupancyGrid about sharing the grid
+        self.occupancy = occupancy if occupancy is not None else OccupancyGrid(size)
 
         self.size = size
         h = self.size[0]
         w = self.size[1]
-        self.pos = (random.randrange(h), random.randrange(w))
+        self.pos = (int(self.rng.integers(h)), int(self.rng.integers(w)))
         self.previous_pos = (self.pos[0]-1, self.pos[1]-1)
         self.color = [255, 255, 255]
         self.stroke_width = 1
+        self.dirty:Optional[brushes.DirtyRects] = None
 
         self.spawn_rate=spawn_rate
         self.step_distance=step_distance
@@ -122,54 +131,211 @@ class FrostDrawer(Agent):
                 self.die(3)
                 return state
             # if meet an existing line
-            line_points = tools.get_line(x_1, y_1, x, y)
-            for p in line_points[1:]:
-                p_x, p_y = p
-                if p_x == self.pos[0] and p_y == self.pos[1]:
-                    continue # skip the current position
-                if state[p_x][p_y][0] == 255:
-                    self.die(4)
-                    return state
+            if self.occupancy.hitsLine(self.pos, new_pos):
+                self.die(4)
+                return state
         except IndexError as E:
             print(E)
             traceback.print_exc(file=sys.stdout)
             self.die(5)
             return state
         # Do spawn
-        if random.random() < self.spawn_rate:
+        if self.rng.random() < self.spawn_rate:
             self.spawn(state)
         # Do step
-        state = cv2.line(state,self.pos[::-1],new_pos[::-1],self.color,self.stroke_width)
+        state = brushes._line(state,self.pos[::-1],new_pos[::-1],self.color,self.stroke_width,self.dirty)
+        self.occupancy.markLine(self.pos, new_pos, self.stroke_width)
         self.previous_pos = self.pos
         self.pos = new_pos
         self.curr_age += self.aging_rate
         return state
 
     def spawn(self, state: np.ndarray) -> None:
-        new_direction = self.step_direction + random.choice([30, -30])
+        new_direction = self.step_direction + (30 if self.rng.random() < 0.5 else -30)
         new_step_distance = self.step_distance*0.8
         if new_step_distance < 1:
             return
         new_spawn_rate = min(self.spawn_rate*0.8, 1.0)
         new_lifespan = int(self.lifespan * 0.9)
 
-        child = FrostDrawer(self.cursor_list, self.size, spawn_rate=new_spawn_rate, step_distance=new_step_distance, step_direction=new_direction)
+        child = FrostDrawer(self.cursor_list, self.size, spawn_rate=new_spawn_rate, step_distance=new_step_distance, step_direction=new_direction, occupancy=self.occupancy, rng=self.rng)
         child.lifespan = new_lifespan
         #child.color = [self.color[0]-1,self.color[1]-1,self.color[2]-1]
         child.pos = self.pos
+        child.dirty = self.dirty
         self.cursor_list.append(child)
 
-def getFrostDrawerAroundRandomSeedPoint(CANVAS_H:int, CANVAS_W:int, angle_beween:int, agent_buffer:List[Agent]) -> None:
-    offset_angle = int(angle_beween * random.random())
-    point = (random.randrange(CANVAS_H), random.randrange(CANVAS_W))
+def getFrostDrawerAroundRandomSeedPoint(CANVAS_H:int, CANVAS_W:int, angle_beween:int, agent_buffer:List[Agent], occupancy:OccupancyGrid, rng:Optional[np.random.Generator]=None) -> None:
+    """
+    occupancy is required: pass the grid shared by everything drawing on the state,
+    otherwise crystals from different seed points would not see each other's lines.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    offset_angle = int(angle_beween * rng.random())
+    point = (int(rng.integers(CANVAS_H)), int(rng.integers(CANVAS_W)))
     # point = (300, 150)
     # print(CANVAS_H, CANVAS_W)
     for theta in range(0,360,angle_beween):
-        c = FrostDrawer(agent_buffer, (CANVAS_H, CANVAS_W))
+        c = FrostDrawer(agent_buffer, (CANVAS_H, CANVAS_W), occupancy=occupancy, rng=rng)
         c.pos = point
         c.step_direction = theta+offset_angle
         agent_buffer.append(c)
 
+class FrostPopulation(Agent):
+    """
+    A population of FrostDrawers stored as arrays (structure of arrays), grown a whole step at a time
+    instead of one method call per crystal.
+
+    The age, bounds, colour boundary and collision checks are array operations and children are spawned in bulk.
+    Children take their first step in the step they are spawned, like FrostDrawers appended to the cursor list,
+    and a line that crosses one drawn earlier in the same step stops, like it would in the cursor list.
+    Lines are one pixel wide, rasterized with tools.get_lines into the state and the occupancy grid.
+    Positions are in drawing [h w] order and directions in degrees, like FrostDrawer.
+    """
+    def __init__(self, size:Tuple[int, int], occupancy:Optional[OccupancyGrid]=None, rng:Optional[np.random.Generator]=None):
+        super().__init__()
+        self.size = size
+        self.rng = rng if rng is not None else np.random.default_rng()
+        # see OccupancyGrid about sharing the grid
+        self.occupancy = occupancy if occupancy is not None else OccupancyGrid(size)
+        self.color = [255, 255, 255]
+
+        self.positions = np.zeros((0, 2), dtype=np.int64)
+        self.step_directions = np.zeros(0, dtype=np.float64)
+        self.step_distances = np.zeros(0, dtype=np.float64)
+        self.spawn_rates = np.zeros(0, dtype=np.float64)
+        self.lifespans = np.zeros(0, dtype=np.int64)
+        self.ages = np.zeros(0, dtype=np.int64)
+        self.alive = np.zeros(0, dtype=bool)
+
+        self.dead = True
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def add(self, positions:Any, step_directions:Any, step_distances:Any=10, spawn_rates:Any=0.9, lifespans:Any=50000) -> None:
+        """
+        Appends crystals. positions is one (x, y) position or an (n, 2) array, the other arguments one value or n values.
+        """
+        positions = np.asarray(positions, dtype=np.int64).reshape(-1, 2)
+        count = max(len(positions), np.size(step_directions))
+        column = lambda values: np.broadcast_to(values, count)
+        # cull crystals that wont move.
+        moving = column(step_distances) >= 1
+        self.positions = np.concatenate((self.positions, np.broadcast_to(positions, (count, 2))[moving]))
+        self.step_directions = np.concatenate((self.step_directions, column(step_directions)[moving]))
+        self.step_distances = np.concatenate((self.step_distances, column(step_distances)[moving]))
+        self.spawn_rates = np.concatenate((self.spawn_rates, column(spawn_rates)[moving]))
+        self.lifespans = np.concatenate((self.lifespans, column(lifespans)[moving].astype(np.int64)))
+        self.ages = np.concatenate((self.ages, np.zeros(int(moving.sum()), dtype=np.int64)))
+        self.alive = np.concatenate((self.alive, np.ones(int(moving.sum()), dtype=bool)))
+        self.dead = len(self) == 0
+
+    def addAroundRandomSeedPoint(self, angle_beween:int) -> None:
+        """ Like getFrostDrawerAroundRandomSeedPoint """
+        offset_angle = int(angle_beween * self.rng.random())
+        point = (int(self.rng.integers(self.size[0])), int(self.rng.integers(self.size[1])))
+        self.add(point, np.arange(0, 360, angle_beween) + offset_angle)
+
+    def stepCrystals(self, indices:np.ndarray, state:np.ndarray, original_image:np.ndarray) -> np.ndarray:
+        """
+        Steps the crystals at indices, in order. Returns the indices of the children they spawned.
+        """
+        positions = self.positions[indices]
+        directions = np.radians(self.step_directions[indices])
+        distances = self.step_distances[indices]
+        # rounded like polarToCartesian
+        new_positions = positions + np.stack((np.rint(distances * np.cos(directions)), np.rint(distances * np.sin(directions))), axis=1).astype(np.int64)
+        # check if dead
+        # if too old
+        ok = self.ages[indices] <= self.lifespans[indices]
+        # if outside the image
+        # state.shape is in cv2 [w h] shape. position is in drawing [h w] shape
+        ok &= (new_positions >= 0).all(axis=1) & (new_positions[:, 0] < state.shape[0]) & (new_positions[:, 1] < state.shape[1])
+        # if color is different
+        starts, ends = positions[ok], new_positions[ok]
+        ok[ok] = (original_image[ends[:, 0], ends[:, 1]] == original_image[starts[:, 0], starts[:, 1]]).all(axis=1)
+        # if meet an existing line, or one drawn before it in this step
+        ok[ok] = ~self.occupancy.hitsLines(positions[ok], new_positions[ok], ordered=True)
+        self.alive[indices[~ok]] = False
+        walking = indices[ok]
+        starts, ends = positions[ok], new_positions[ok]
+
+        # Do spawn. Children start where their parent is before it steps.
+        spawning = walking[self.rng.random(len(walking)) < self.spawn_rates[walking]]
+        first_child = len(self)
+        turns = np.where(self.rng.random(len(spawning)) < 0.5, 30, -30)
+        self.add(self.positions[spawning], self.step_directions[spawning] + turns, self.step_distances[spawning] * 0.8,
+                np.minimum(self.spawn_rates[spawning] * 0.8, 1.0), (self.lifespans[spawning] * 0.9).astype(np.int64))
+
+        # Do step
+        points, line_ids = tools.get_lines(starts, ends)
+        brushes._rasterizedLines(state, points[:, ::-1], line_ids, self.color, self.dirty)
+        self.occupancy.markPoints(points)
+        self.positions[walking] = ends
+        self.ages[walking] += self.aging_rate
+        return np.arange(first_child, len(self))
+
+    def step(self, step:int, state:np.ndarray, original_image:np.ndarray) -> np.ndarray:
+        indices = np.flatnonzero(self.alive)
+        while len(indices) > 0:
+            indices = self.stepCrystals(indices, state, original_image)
+        # drop the dead, like tools.removeDead
+        alive = self.alive
+        for name in ["positions", "step_directions", "step_distances", "spawn_rates", "lifespans", "ages", "alive"]:
+            setattr(self, name, getattr(self, name)[alive])
+        self.dead = len(self) == 0
+        return state
+
+class UnitVectorField:
+    """
+    A terrain of directions (in radians) compiled once into cos and sin lookup tables,
+    so vector field agents look their step up instead of calling math.cos and math.sin every step.
+
+    Indexes like the terrain it wraps (field[x][y] is the direction), so it can be passed anywhere a terrain is.
+    """
+    def __init__(self, terrain:np.ndarray):
+        self.terrain = terrain
+        self.shape = terrain.shape
+        self.cos = np.cos(terrain)
+        self.sin = np.sin(terrain)
+        self.step_offsets:dict = {}
+
+    def __getitem__(self, index:Any) -> Any:
+        return self.terrain[index]
+
+    def stepOffsets(self, magnitude:float) -> np.ndarray:
+        """
+        polarToCartesian((abs(magnitude), direction)) for every position, as an [h w 2] array of the smallest int type that fits.
+        Built once per magnitude and reused. A negative magnitude shares the table of the positive one,
+        its offsets are the negated ones (see stepOffset and stepOffsetsAt).
+        """
+        magnitude = abs(magnitude)
+        if magnitude not in self.step_offsets:
+            dtype = np.int8 if magnitude < 127 else np.int16 if magnitude < 32767 else np.int32
+            # rounded like polarToCartesian
+            self.step_offsets[magnitude] = np.stack((np.rint(magnitude * self.cos), np.rint(magnitude * self.sin)), axis=-1).astype(dtype)
+        return self.step_offsets[magnitude]
+
+    def stepOffset(self, position:Tuple[int, int], magnitude:float) -> Tuple[int, int]:
+        """
+        polarToCartesian((magnitude, field[x][y])). Raises IndexError like terrain[x][y] would.
+        """
+        offsets = self.stepOffsets(magnitude)
+        x, y = position
+        if magnitude < 0:
+            # rint is symmetric, so the offsets of -m are exactly the negated offsets of m
+            return (-offsets.item(x, y, 0), -offsets.item(x, y, 1))
+        return (offsets.item(x, y, 0), offsets.item(x, y, 1))
+
+    def stepOffsetsAt(self, x:np.ndarray, y:np.ndarray, magnitude:float) -> np.ndarray:
+        """
+        stepOffset for many positions at once, as an (n, 2) int64 array.
+        """
+        offsets = self.stepOffsets(magnitude)[x, y].astype(np.int64)
+        return -offsets if magnitude < 0 else offsets
+
 class VectorFieldVisualizer(Agent):
     """
     An agent that just draws the vector they are located at and does not move or change otherwise.
@@ -180,6 +346,7 @@ class VectorFieldVisualizer(Agent):
 
         self.color = [255, 0, 0]
         self.stroke_width = 1
+        self.dirty:Optional[brushes.DirtyRects] = None
 
         self.magnitude=magnitude
         self.direction_rads=direction_rads
@@ -189,7 +356,10 @@ class VectorFieldVisualizer(Agent):
     def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
         # 1. Calculate new position
         """ Never change position, but calculate draw here """
-        end_point_diff = self.polarToCartesian((self.magnitude, self.direction_rads))
+        if isinstance(terrain, UnitVectorField):
+            end_point_diff = terrain.stepOffset(self.position, self.magnitude)
+        else:
+            end_point_diff = self.polarToCartesian((self.magnitude, self.direction_rads))
         end_point = self.addPoints(self.position, end_point_diff)
         # 2. Check if dead
         """ Die immediately """
@@ -199,7 +369,7 @@ class VectorFieldVisualizer(Agent):
         # 4. Do draw
         # draw a line indicating the vector field value at this position.
         # ie, draw a line at the vector angle and with a length representing the magnitude.
-        state = cv2.line(state,self.position[::-1],end_point[::-1],self.color,self.stroke_width)
+        state = brushes._line(state,self.position[::-1],end_point[::-1],self.color,self.stroke_width,self.dirty)
         # 5. Do step
         """ never change on step """
         return state
@@ -223,19 +393,41 @@ class VectorFieldWalker(Agent):
         self.next_position = position
         self.position_history: List[Tuple[int, int]] = [position]
 
-        self.brush:Callable[[np.ndarray, List[Tuple[int, int]]], np.ndarray] = brushes.simpleBorderPolyLine
+        # incremental brushes keep per-stroke state, so each walker gets its own.
+        self.brush:Callable[[np.ndarray, List[Tuple[int, int]]], np.ndarray] = brushes.simpleBorderPolyLineStroke()
 
         self.magnitude=magnitude
         self.direction_rads=direction_rads
+        self.step_offset = self.polarToCartesian((self.stepMagnitude(), direction_rads))
 
         self.dead = False
 
+    def stepMagnitude(self) -> float:
+        return self.magnitude
+
     def calculateNextPosition(self) -> Tuple[int,int]:
-        new_point_diff = self.polarToCartesian((self.magnitude, self.direction_rads))
-        new_point = self.addPoints(self.position, new_point_diff)
+        new_point = self.addPoints(self.position, self.step_offset)
         return new_point
 
+    def lookupDirection(self, terrain:Any) -> None:
+        """
+        Sets the direction and step for the current position.
+        Positions outside the terrain keep the previous ones.
+        """
+        try:
+            if isinstance(terrain, UnitVectorField):
+                self.step_offset = terrain.stepOffset(self.position, self.stepMagnitude())
+                self.direction_rads = terrain.terrain.item(self.position)
+            else:
+                self.direction_rads = terrain[self.position[0]][self.position[1]]
+                self.step_offset = self.polarToCartesian((self.stepMagnitude(), self.direction_rads))
+        except IndexError:
+            pass
+
     def checkDead(self, state:np.ndarray) -> bool:
+        # if stopped by another agent earlier in this step
+        if self.dead:
+            return True
         # if too much points (probably in an infinite loop)
         if len(self.position_history) > 5000:
             self.die('too big')
@@ -252,7 +444,7 @@ class VectorFieldWalker(Agent):
         return False
 
     def doDraw(self, state:np.ndarray) -> None:
-        state = self.brush(state, self.position_history)
+        state = self.brush(state, self.position_history, dirty=self.dirty)
 
     def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
         # 1. Calculate new position
@@ -268,57 +460,425 @@ class VectorFieldWalker(Agent):
         self.position = self.next_position
         self.position_history.append(self.next_position)
         self.curr_age += self.aging_rate
-        try:
-            self.direction_rads = terrain[self.position[0]][self.position[1]]
-        except IndexError:
-            pass
+        self.lookupDirection(terrain)
         return state
 
-class VectorFieldBackwardWalker(VectorFieldWalker):
+def bilinearDirection(terrain:Any, x:float, y:float) -> Optional[Tuple[float, float]]:
+    """
+    The terrain direction at a sub-pixel position, as a unit vector in drawing [h w] order.
+    Interpolates the unit vectors of the 4 surrounding pixels, not the angles. Returns None outside the terrain.
+    """
+    h, w = terrain.shape[:2]
+    if not (0 <= x <= h - 1 and 0 <= y <= w - 1):
+        return None
+    x0 = min(int(x), max(h - 2, 0))
+    y0 = min(int(y), max(w - 2, 0))
+    x1 = min(x0 + 1, h - 1)
+    y1 = min(y0 + 1, w - 1)
+    fx = x - x0
+    fy = y - y0
+    if isinstance(terrain, UnitVectorField):
+        cos, sin = terrain.cos, terrain.sin
+        corners_cos = (cos.item(x0, y0), cos.item(x0, y1), cos.item(x1, y0), cos.item(x1, y1))
+        corners_sin = (sin.item(x0, y0), sin.item(x0, y1), sin.item(x1, y0), sin.item(x1, y1))
+    else:
+        corners = (terrain[x0][y0], terrain[x0][y1], terrain[x1][y0], terrain[x1][y1])
+        corners_cos = tuple(math.cos(a) for a in corners)
+        corners_sin = tuple(math.sin(a) for a in corners)
+    weights = ((1 - fx) * (1 - fy), (1 - fx) * fy, fx * (1 - fy), fx * fy)
+    vx = sum(wt * c for wt, c in zip(weights, corners_cos))
+    vy = sum(wt * c for wt, c in zip(weights, corners_sin))
+    length = math.hypot(vx, vy)
+    if length == 0:
+        return None
+    return (vx / length, vy / length)
+
+INTEGRATORS = ["euler", "rk2", "rk4"]
+
+def checkIntegrator(integrator:str) -> None:
+    if integrator not in INTEGRATORS:
+        raise ValueError(f"unknown integrator {integrator!r}, expected one of {INTEGRATORS}")
+
+class SubPixelVectorFieldWalker(VectorFieldWalker):
     """
-    This is a version of VectorFieldWalker that moves backwards,
-    or 180 offset from the terrain direction.
+    A VectorFieldWalker that keeps a float position and follows the bilinearly interpolated terrain,
+    instead of rounding every step to a pixel and sampling the terrain at the rounded position.
 
-    It does no drawing, but the position_history is used by a corresponding
-    "front facing" VectorFieldWalker to draw a full line in two directions
+    integrator: "euler", "rk2" (midpoint) or "rk4". Each step moves 'magnitude' pixels along the field.
+    min_segment: a vertex is only added to the position history once the path has moved this many pixels
+        from the previous vertex, so short steps do not fill the history with duplicated points.
     """
-    def __init__(self, cursor_list:List[Agent], position:Tuple[int, int], partner_walker:VectorFieldWalker, magnitude:float=1, direction_rads:float=0):
+    def __init__(self, cursor_list:List[Agent], position:Tuple[int, int], magnitude:float=1, direction_rads:float=0,
+            integrator:str="rk4", min_segment:float=1):
         super().__init__(cursor_list, position, magnitude, direction_rads)
-        self.partner_walker = partner_walker
+        checkIntegrator(integrator)
+        self.integrator = integrator
+        self.min_segment = min_segment
+        self.float_position = (float(position[0]), float(position[1]))
+        self.last_vertex = self.float_position
+        # used wherever the terrain can not be sampled, like the previous direction in VectorFieldWalker
+        self.velocity = (math.cos(direction_rads), math.sin(direction_rads))
+
+    def velocityAt(self, terrain:Any, position:Tuple[float, float]) -> Tuple[float, float]:
+        v = bilinearDirection(terrain, position[0], position[1])
+        return self.velocity if v is None else v
+
+    def integrate(self, terrain:Any) -> Tuple[float, float]:
+        """
+        One step of the integrator from the current float position. Returns the new float position.
+        """
+        m = self.stepMagnitude()
+        x, y = self.float_position
+        k1 = self.velocityAt(terrain, (x, y))
+        if self.integrator == "euler":
+            v = k1
+        elif self.integrator == "rk2":
+            v = self.velocityAt(terrain, (x + m/2 * k1[0], y + m/2 * k1[1]))
+        else: # rk4
+            k2 = self.velocityAt(terrain, (x + m/2 * k1[0], y + m/2 * k1[1]))
+            k3 = self.velocityAt(terrain, (x + m/2 * k2[0], y + m/2 * k2[1]))
+            k4 = self.velocityAt(terrain, (x + m * k3[0], y + m * k3[1]))
+            v = ((k1[0] + 2*k2[0] + 2*k3[0] + k4[0]) / 6, (k1[1] + 2*k2[1] + 2*k3[1] + k4[1]) / 6)
+        self.velocity = k1
+        self.direction_rads = math.atan2(k1[1], k1[0])
+        return (x + m * v[0], y + m * v[1])
 
-    def calculateNextPosition(self) -> Tuple[int,int]:
-        new_point_diff = self.polarToCartesian((0-self.magnitude, self.direction_rads))
-        new_point = self.addPoints(self.position, new_point_diff)
-        # Inject my positin into the partner walker's position history
-        self.partner_walker.position_history.insert(0, new_point)
-        return new_point
+    def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
+        # 1. Calculate new position
+        self.float_position = self.integrate(terrain)
+        self.next_position = (int(round(self.float_position[0])), int(round(self.float_position[1])))
+        # 2. Check if dead
+        if self.checkDead(state):
+            return state
+        # 3. Do spawn
+        self.doSpawn()
+        # 4. Do step, only keeping a vertex once the path has moved far enough
+        self.curr_age += self.aging_rate
+        moved = math.hypot(self.float_position[0] - self.last_vertex[0], self.float_position[1] - self.last_vertex[1])
+        if moved < self.min_segment or self.next_position == self.position:
+            return state
+        self.last_vertex = self.float_position
+        self.position = self.next_position
+        self.position_history.append(self.next_position)
+        # 5. Do draw, only when there is a new vertex
+        self.doDraw(state)
+        return state
 
-    def doDraw(self, state):
-        pass
+class VectorFieldWalkerPopulation(Agent):
+    """
+    A population of VectorFieldWalkers stored as arrays (structure of arrays) instead of one object per walker.
+
+    Positions, directions, ages and alive flags are numpy arrays and every walker is advanced
+    in one vectorized step. Each walker follows the same path a VectorFieldWalker created with
+    the same position, magnitude and direction would. The walkers are drawn one after the other with their own
+    border and line, so the state ends up the same as drawing those VectorFieldWalkers with simpleBorderPolyLineStroke.
+    """
+    def __init__(self, cursor_list:List[Agent], positions:List[Tuple[int, int]], magnitude:float=1, directions_rads:Any=0):
+        super().__init__()
+        self.cursor_list = cursor_list
+        self.positions = np.array(positions, dtype=np.int64).reshape(-1, 2)
+        count = len(self.positions)
+        self.directions_rads = np.zeros(count, dtype=np.float64)
+        self.directions_rads[:] = directions_rads
+        self.ages = np.zeros(count, dtype=np.int64)
+        self.alive = np.ones(count, dtype=bool)
+        self.history_lengths = np.ones(count, dtype=np.int64)
+        # [step walker 2] positions, the first 'steps_recorded' steps are used. Grown by doubling, so appending is O(1).
+        # Dead walkers keep repeating their last position.
+        self.history = np.empty((64, count, 2), dtype=np.int64)
+        self.history[0] = self.positions
+        self.steps_recorded = 1
+        self.drawn_length = 0
+
+        self.brush:Callable[[np.ndarray, List[Tuple[np.ndarray, int]]], np.ndarray] = brushes.simpleBorderPolyLineTails
+
+        self.magnitude=magnitude
+        self.step_offsets = self.polarToCartesianArray(self.directions_rads)
+
+        self.dead = count == 0
+
+    def polarToCartesianArray(self, directions_rads:np.ndarray) -> np.ndarray:
+        x = self.magnitude * np.cos(directions_rads)
+        y = self.magnitude * np.sin(directions_rads)
+        # rounded like polarToCartesian
+        return np.stack((np.rint(x), np.rint(y)), axis=1).astype(np.int64)
+
+    def calculateNextPosition(self) -> np.ndarray:
+        return self.positions + self.step_offsets
+
+    def checkDead(self, state:np.ndarray) -> bool:
+        # too much points (probably in an infinite loop) or too old
+        self.alive &= (self.history_lengths <= 5000) & (self.ages <= self.lifespan)
+        if not self.alive.any():
+            self.die()
+            return True
+        return False
+
+    def doDraw(self, state:np.ndarray) -> None:
+        # Only the newest segments are drawn, plus enough of the previous ones for the brush to restore the line.
+        # Every walker that is still alive has moved on every step, so they share the full history length.
+        new_points = self.steps_recorded - self.drawn_length
+        window = self.history[max(self.drawn_length - 32, 0):self.steps_recorded]
+        window = np.ascontiguousarray(window[:, self.alive, ::-1].transpose(1, 0, 2), dtype=np.int32) # cv2 uses (x, y)
+        drawn = len(window[0]) - new_points
+        # one walker at a time, border then line, so later walkers cover earlier ones like the agent buffer order does
+        for pts in window:
+            self.brush(state, [(pts, drawn)], dirty=self.dirty)
+        self.drawn_length = self.steps_recorded
+
+    def recordPositions(self) -> None:
+        if self.steps_recorded == len(self.history):
+            grown = np.empty((2 * len(self.history),) + self.history.shape[1:], dtype=np.int64)
+            grown[:self.steps_recorded] = self.history
+            self.history = grown
+        self.history[self.steps_recorded] = self.positions
+        self.steps_recorded += 1
+
+    def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
+        # 1. Calculate new positions
+        next_positions = self.calculateNextPosition()
+        # 2. Check if dead
+        if self.checkDead(state):
+            return state
+        # 3. Do spawn
+        self.doSpawn()
+        # 4. Do draw
+        self.doDraw(state)
+        # 5. Do step
+        walking = self.alive
+        self.positions[walking] = next_positions[walking]
+        self.recordPositions()
+        self.history_lengths[walking] += 1
+        self.ages[walking] += self.aging_rate
+        # gather the new directions. Matches terrain[x][y] in VectorFieldWalker:
+        # negative indices wrap and positions outside the terrain keep their direction.
+        x = self.positions[:, 0]
+        y = self.positions[:, 1]
+        h, w = terrain.shape[:2]
+        inside = walking & (x >= -h) & (x < h) & (y >= -w) & (y < w)
+        x = x[inside]
+        y = y[inside]
+        if isinstance(terrain, UnitVectorField):
+            self.directions_rads[inside] = terrain.terrain[x, y]
+            self.step_offsets[inside] = terrain.stepOffsetsAt(x, y, self.magnitude)
+        else:
+            self.directions_rads[inside] = terrain[x, y]
+            self.step_offsets[inside] = self.polarToCartesianArray(self.directions_rads[inside])
+        return state
 
+    def paths(self) -> List[List[Tuple[int, int]]]:
+        """
+        Returns the position_history of each walker as a list of points, as a VectorFieldWalker would have it.
+        """
+        paths = self.history[:self.steps_recorded]
+        return [[tuple(p) for p in paths[:length, i].tolist()] for i, length in enumerate(self.history_lengths)]
 
-def VectorFieldWalkerFactory_1(vectorField:np.ndarray, agent_buffer:List[Agent], count:int) -> List[Agent]:
+class VectorFieldStroke(Agent):
+    """
+    A line that grows from its start position both ways along the terrain, drawn as one border polyline.
+
+    Each end is walked by its own head, a VectorFieldWalker that is not in the agent buffer and does not draw.
+    The heads only ever append to their position history, so extending either end is O(1),
+    and the stroke only draws the newest segments of each end.
+    integrator: "euler", "rk2" or "rk4" to walk with SubPixelVectorFieldWalkers
+    """
+    def __init__(self, cursor_list:List[Agent], position:Tuple[int, int], magnitude:float=1, direction_rads:float=0, integrator:Optional[str]=None):
+        super().__init__()
+        self.cursor_list = cursor_list
+        self.position = position
+        # heads[0] walks with the terrain direction, heads[1] 180 degrees from it
+        self.heads:List[VectorFieldWalker] = []
+        for head_magnitude in (magnitude, 0-magnitude):
+            if integrator is None:
+                head = VectorFieldWalker([], position, head_magnitude, direction_rads)
+            else:
+                head = SubPixelVectorFieldWalker([], position, head_magnitude, direction_rads, integrator)
+            head.brush = lambda state, points, dirty=None: state
+            self.heads.append(head)
+
+        self.brush:Callable[[np.ndarray, List[List[Tuple[int, int]]]], np.ndarray] = brushes.simpleBorderPolyLineBidirectional()
+
+        self.magnitude=magnitude
+        self.direction_rads=direction_rads
+
+        self.dead = False
+
+    def path(self) -> List[Tuple[int, int]]:
+        """ The whole line, from the end of heads[1] to the end of heads[0] """
+        return self.heads[1].position_history[::-1] + self.heads[0].position_history[1:]
+
+    def stopEnd(self, index:int, length:int) -> None:
+        """
+        Stops heads[index], keeping the first 'length' points of its end. Only drop points that are not drawn yet.
+        """
+        head = self.heads[index]
+        head.die()
+        del head.position_history[length:]
+
+    def checkDead(self, state:np.ndarray) -> bool:
+        if self.dead:
+            return True
+        # each head dies of old age on its own
+        walking = [not head.checkDead(state) for head in self.heads]
+        # if too much points (probably in an infinite loop)
+        points = len(self.heads[0].position_history) + len(self.heads[1].position_history) - 1
+        if not any(walking) or points > 5000:
+            self.die()
+            return True
+        return False
+
+    def doDraw(self, state:np.ndarray) -> None:
+        state = self.brush(state, [head.position_history for head in self.heads], dirty=self.dirty)
+
+    def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
+        # 1. Check if dead
+        if self.checkDead(state):
+            return state
+        # 2. Do draw
+        self.doDraw(state)
+        # 3. Do step, each head that is still walking extends its end
+        for head in self.heads:
+            if not head.dead:
+                head.doStep(step, state, terrain)
+        return state
+
+class StreamlineSeeder(Agent):
+    """
+    Seeds evenly spaced strokes over a vector field, in the style of Jobard and Lefer's evenly spaced streamlines.
+
+    Each stroke is a VectorFieldStroke growing both ways from a seed position. Every point it adds is checked against
+    a PathGrid of the points of the other strokes, and an end stops as soon as it comes within
+    separation * test_ratio of another stroke or leaves the terrain.
+    When both ends of a stroke have stopped, candidate seeds are placed 'separation' away on both sides of its points.
+    New strokes start from the candidates, skipping those already within 'separation' of a stroke.
+    Does not draw, the strokes it adds to the agent buffer do. Dies when no stroke is running and no candidate is left.
+    """
+    def __init__(self, cursor_list:List[Agent], vectorField:Any, seed_position:Tuple[int, int], separation:float=20,
+            test_ratio:float=0.5, magnitude:float=2, max_active:int=1, max_steps:int=1000, integrator:Optional[str]=None):
+        super().__init__()
+        self.cursor_list = cursor_list
+        self.vectorField = vectorField
+        self.separation = separation
+        self.test_distance = separation * test_ratio
+        self.magnitude = magnitude
+        self.max_active = max_active
+        self.max_steps = max_steps
+        if integrator is not None:
+            checkIntegrator(integrator) # strokes are only created once it steps
+        self.integrator = integrator
+        self.path_grid = PathGrid(separation)
+        self.candidates = deque([seed_position])
+        # stroke id -> (stroke, number of points checked for each end)
+        self.strokes:Dict[int, Tuple[VectorFieldStroke, List[int]]] = {}
+        self.stroke_count = 0
+        self.dead = False
+
+    def isInside(self, position:Tuple[int, int]) -> bool:
+        h, w = self.vectorField.shape[:2]
+        return 0 <= position[0] < h and 0 <= position[1] < w
+
+    def startStroke(self, position:Tuple[int, int]) -> None:
+        stroke_id = self.stroke_count
+        self.stroke_count += 1
+        stroke = VectorFieldStroke(self.cursor_list, position, self.magnitude, self.vectorField[position[0]][position[1]], self.integrator)
+        for head in stroke.heads:
+            head.aging_rate = 1
+            head.lifespan = self.max_steps
+        stroke.dirty = self.dirty
+        self.cursor_list.append(stroke)
+        self.strokes[stroke_id] = (stroke, [0, 0])
+
+    def checkEnd(self, stroke_id:int, stroke:VectorFieldStroke, index:int, checked:int) -> int:
+        """
+        Adds the new points of one end of the stroke to the path grid, stopping the end before
+        the first point that is too close to another stroke. Returns the number of points checked.
+        The seeder steps before its strokes, so the new points are not drawn yet.
+        """
+        head = stroke.heads[index]
+        history = head.position_history
+        while checked < len(history):
+            position = history[checked]
+            if not self.isInside(position) or self.path_grid.isNear(position, self.test_distance, stroke_id):
+                stroke.stopEnd(index, checked)
+                break
+            self.path_grid.add(position, stroke_id)
+            checked += 1
+        return checked
+
+    def addCandidates(self, stroke:VectorFieldStroke) -> None:
+        for head in stroke.heads:
+            for (x, y) in head.position_history:
+                direction_rads = self.vectorField[x][y]
+                normal = (-self.separation * math.sin(direction_rads), self.separation * math.cos(direction_rads))
+                self.candidates.append((int(round(x + normal[0])), int(round(y + normal[1]))))
+                self.candidates.append((int(round(x - normal[0])), int(round(y - normal[1]))))
+
+    def doStep(self, step:int, state:np.ndarray, terrain:np.ndarray) -> np.ndarray:
+        # 1. Check the points added by the walkers last step
+        for stroke_id, (stroke, checked) in list(self.strokes.items()):
+            for index in range(2):
+                checked[index] = self.checkEnd(stroke_id, stroke, index, checked[index])
+            if stroke.dead or all(head.dead for head in stroke.heads):
+                self.addCandidates(stroke)
+                del self.strokes[stroke_id]
+        # 2. Start new strokes from the candidates that are still far enough from every stroke
+        while len(self.strokes) < self.max_active and self.candidates:
+            position = self.candidates.popleft()
+            if self.isInside(position) and not self.path_grid.isNear(position, self.separation):
+                self.startStroke(position)
+        # 3. Check if dead
+        if not self.strokes and not self.candidates:
+            self.die()
+        return state
+
+def VectorFieldWalkerFactory_1(vectorField:np.ndarray, agent_buffer:List[Agent], count:int, batched:bool=False, rng:Optional[np.random.Generator]=None,
+        integrator:Optional[str]=None) -> List[Agent]:
     """
     Create 'count' walkers at random locations
+    batched: add a single VectorFieldWalkerPopulation instead of one agent per walker
+    integrator: "euler", "rk2" or "rk4" to create SubPixelVectorFieldWalkers. Not used when batched.
     """
+    if rng is None:
+        rng = np.random.default_rng()
     shape = vectorField.shape
+    positions = []
     for x in range(0, count):
-        pos = (random.randrange(shape[0]), random.randrange(shape[1]))
-        v = VectorFieldWalker(agent_buffer, pos, 10, vectorField[pos[0]][pos[1]])
+        pos = (int(rng.integers(shape[0])), int(rng.integers(shape[1])))
+        positions.append(pos)
+    if batched:
+        directions = [vectorField[pos[0]][pos[1]] for pos in positions]
+        agent_buffer.append(VectorFieldWalkerPopulation(agent_buffer, positions, 10, directions))
+        return agent_buffer
+    for pos in positions:
+        if integrator is None:
+            v = VectorFieldWalker(agent_buffer, pos, 10, vectorField[pos[0]][pos[1]])
+        else:
+            v = SubPixelVectorFieldWalker(agent_buffer, pos, 10, vectorField[pos[0]][pos[1]], integrator)
         agent_buffer.append(v)
     return agent_buffer
 
-def VectorFieldWalkerFactory_2(vectorField:np.ndarray, agent_buffer:List[Agent], step:int) -> List[Agent]:
+def VectorFieldWalkerFactory_2(vectorField:np.ndarray, agent_buffer:List[Agent], step:int, batched:bool=False,
+        integrator:Optional[str]=None) -> List[Agent]:
     """
     Create walkers at regular locations all over the terrain at 'step' intervals
+    batched: add a single VectorFieldWalkerPopulation instead of one agent per walker
+    integrator: "euler", "rk2" or "rk4" to create SubPixelVectorFieldWalkers. Not used when batched.
     """
     shape = vectorField.shape
+    if batched:
+        positions = [(x, y) for x in range(0, shape[0], step) for y in range(0, shape[1], step)]
+        directions = [vectorField[x][y] for (x, y) in positions]
+        agent_buffer.append(VectorFieldWalkerPopulation(agent_buffer, positions, 2, directions))
+        return agent_buffer
     for x in range(0, shape[0], step):
         for y in range(0, shape[1], step):
             # build the brush function
 
-            v = VectorFieldWalker(agent_buffer, (x, y), 2, vectorField[x][y])
-            bsh = brushes.simpleBorderPolyLine
+            if integrator is None:
+                v = VectorFieldWalker(agent_buffer, (x, y), 2, vectorField[x][y])
+            else:
+                v = SubPixelVectorFieldWalker(agent_buffer, (x, y), 2, vectorField[x][y], integrator)
+            bsh = brushes.simpleBorderPolyLineStroke()
             v.brush = bsh
             agent_buffer.append(v)
     return agent_buffer
@@ -330,10 +890,18 @@ def VectorFieldWalkerFactory_3(vectorField:np.ndarray, agent_buffer:List[Agent],
     shape = vectorField.shape
     y = int(shape[1]/2)
     for x in range(0, shape[0], step):
-        v = VectorFieldWalker(agent_buffer, (x, y), 10, vectorField[x][y])
-        v_back = VectorFieldBackwardWalker(agent_buffer, (x, y), v, 10, vectorField[x][y])
-        bsh = brushes.simpleBorderPolyLine
-        v.brush = bsh
+        v = VectorFieldStroke(agent_buffer, (x, y), 10, vectorField[x][y])
         agent_buffer.append(v)
-        agent_buffer.append(v_back)
+    return agent_buffer
+
+def VectorFieldWalkerFactory_4(vectorField:np.ndarray, agent_buffer:List[Agent], separation:float, max_active:int=1,
+        integrator:Optional[str]=None) -> List[Agent]:
+    """
+    Create evenly spaced strokes about 'separation' pixels apart, seeded from the middle of the terrain by a StreamlineSeeder.
+    max_active: the number of strokes walking at the same time
+    integrator: "euler", "rk2" or "rk4" to use SubPixelVectorFieldWalkers
+    """
+    shape = vectorField.shape
+    seed_position = (int(shape[0]/2), int(shape[1]/2))
+    agent_buffer.append(StreamlineSeeder(agent_buffer, vectorField, seed_position, separation, max_active=max_active, integrator=integrator))
     return agent_buffer
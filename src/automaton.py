@@ -0,0 +1,65 @@
+import numpy as np
+from typing import Optional
+
+"""
+Whole grid engine for the generator_v1 boxel automaton.
+
+Instead of a grid of boxel functions, each cell holds the id of its rule, and the whole grid
+is stepped at once with numpy. Edges wrap around, so the grid is a torus of any h x w.
+
+Rules, with state[x][y] the value of the cell and the ids as in generator_v1:
+0 do nothing: state[x][y]
+1 move up: state[x+1][y]
+2 move down: state[x-1][y]
+3 move left: state[x][y+1]
+4 move right: state[x][y-1]
+5 pick avg: floor of the mean of the 3x3 neighbourhood
+6 random: a random value in [0 max_val)
+"""
+
+DO_NOTHING, MOVE_UP, MOVE_DOWN, MOVE_LEFT, MOVE_RIGHT, PICK_AVG, RANDOM = range(7)
+# chance of each rule in randomBoxels, from the cum_weights generator_v1 used: [1, 4, 7, 10, 13, 14, 15]
+RULE_WEIGHTS = np.array([1, 3, 3, 3, 3, 1, 1]) / 15
+
+def randomBoxels(h:int, w:int, rng:Optional[np.random.Generator]=None) -> np.ndarray:
+    """ A [h w] grid of rule ids """
+    if rng is None:
+        rng = np.random.default_rng()
+    return rng.choice(len(RULE_WEIGHTS), size=(h, w), p=RULE_WEIGHTS).astype(np.uint8)
+
+def cycleState(h:int, w:int, max_val:int) -> np.ndarray:
+    """ A [h w] state counting 0 .. max_val-1 over and over, row by row """
+    return (np.arange(h * w) % max_val).astype(np.min_scalar_type(max_val - 1)).reshape(h, w)
+
+class BoxelAutomaton:
+    """
+    Steps a state with a fixed grid of rule ids.
+
+    The rules never change, so where every cell reads its next value from is worked out once:
+    the do nothing and move rules become one gather of the whole state (a toroidal shift per cell),
+    pick avg cells gather their 9 neighbours, and random cells get one bulk draw per step.
+    """
+    def __init__(self, boxels:np.ndarray):
+        self.boxels = boxels
+        h, w = boxels.shape
+        rows, cols = np.indices((h, w))
+        rows[boxels == MOVE_UP] += 1
+        rows[boxels == MOVE_DOWN] -= 1
+        cols[boxels == MOVE_LEFT] += 1
+        cols[boxels == MOVE_RIGHT] -= 1
+        # flat index of the cell each cell copies. Pick avg and random cells are overwritten after the copy.
+        self.sources = ((rows % h) * w + cols % w).ravel()
+        self.avg_cells = np.flatnonzero(boxels == PICK_AVG)
+        avg_rows, avg_cols = np.divmod(self.avg_cells, w)
+        self.avg_neighbours = np.stack([((avg_rows + dx) % h) * w + (avg_cols + dy) % w for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        self.random_cells = np.flatnonzero(boxels == RANDOM)
+
+    def step(self, state:np.ndarray, max_val:int, rng:Optional[np.random.Generator]=None) -> np.ndarray:
+        """ Returns the next state """
+        if rng is None:
+            rng = np.random.default_rng()
+        flat = state.ravel()
+        new_state = flat.take(self.sources)
+        new_state[self.avg_cells] = flat.take(self.avg_neighbours).sum(axis=0) // 9
+        new_state[self.random_cells] = rng.integers(max_val, size=len(self.random_cells), dtype=new_state.dtype)
+        return new_state.reshape(state.shape)
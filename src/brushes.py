@@ -1,6 +1,6 @@
-import cv2
+import cv2, math
 import numpy as np
-from typing import Tuple, List
+from typing import Tuple, List, Optional
 
 """
 Functions that draw brush strokes.
@@ -9,23 +9,197 @@ Underscore functions require all args to be provided. These are "raw brushes".
 
 Functions without underscores (eg: simpleRedLine) should wrap a raw brush with specific args.
 The only args should be the "state", the start position and end position.
+
+Raw brushes take an optional DirtyRects and record the bounding box of what they draw in it,
+so a display can update only those regions (see src/display.py). Wrapping brushes pass it through.
 """
 
-def _line(state:np.ndarray, start:Tuple[int, int], end:Tuple[int, int], color:List[int], stroke_width:int) -> np.ndarray:
+class DirtyRects:
+    """
+    (x, y, w, h) boxes in cv2 (x, y) order drawn into since the last take().
+    Owned by whatever shows the state (eg. a Display) and passed to the brushes drawing on that state.
+    """
+    def __init__(self) -> None:
+        self.rects:List[Tuple[int, int, int, int]] = []
+
+    def mark(self, pts:np.ndarray, thickness:int) -> None:
+        """ pts are cv2 (x, y) points of a line 'thickness' pixels wide """
+        if len(pts) == 0:
+            return
+        pts = pts.reshape((-1, 2))
+        pad = thickness // 2 + 2
+        x0, y0 = pts.min(axis=0)
+        x1, y1 = pts.max(axis=0)
+        self.rects.append((int(x0) - pad, int(y0) - pad, int(x1 - x0) + 2 * pad + 1, int(y1 - y0) + 2 * pad + 1))
+
+    def markLines(self, points:np.ndarray, line_ids:np.ndarray, thickness:int) -> None:
+        """ One box per line. points are cv2 (x, y) points, line after line, line_ids is the line of each point """
+        if len(points) == 0:
+            return
+        firsts = np.flatnonzero(np.concatenate(([True], line_ids[1:] != line_ids[:-1])))
+        pad = thickness // 2 + 2
+        for (x0, y0), (x1, y1) in zip(np.minimum.reduceat(points, firsts).tolist(), np.maximum.reduceat(points, firsts).tolist()):
+            self.rects.append((x0 - pad, y0 - pad, x1 - x0 + 2 * pad + 1, y1 - y0 + 2 * pad + 1))
+
+    def take(self) -> List[Tuple[int, int, int, int]]:
+        """ Returns the boxes drawn into since the last call and starts a new list """
+        rects = self.rects
+        self.rects = []
+        return rects
+
+def _line(state:np.ndarray, start:Tuple[int, int], end:Tuple[int, int], color:List[int], stroke_width:int, dirty:Optional[DirtyRects]=None) -> np.ndarray:
      state = cv2.line(state, start, end, color, stroke_width)
+     if dirty is not None:
+         dirty.mark(np.array((start, end)), stroke_width)
      return state
 
-def simpleRedLine(state:np.ndarray, start:Tuple[int, int], end:Tuple[int, int]) -> np.ndarray:
-    return _line(state, start, end, [255, 0, 0], 1)
+def _rasterizedLines(state:np.ndarray, points:np.ndarray, line_ids:np.ndarray, color:List[int], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+    """
+    One pixel wide lines that are already rasterized (eg. by tools.get_lines), drawn with one write instead of a cv2.line call per line.
+    points are cv2 (x, y) points, line after line. line_ids is the line of each point.
+    """
+    state[points[:, 1], points[:, 0]] = color
+    if dirty is not None:
+        dirty.markLines(points, line_ids, 1)
+    return state
+
+def simpleRedLine(state:np.ndarray, start:Tuple[int, int], end:Tuple[int, int], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+    return _line(state, start, end, [255, 0, 0], 1, dirty)
 
-def _borderPolyLine(state:np.ndarray, points:List[Tuple[int, int]], line_color:List[int], border_color:List[int], stroke_width:int, border_thickness:int) -> np.ndarray:
+def _borderPolyLine(state:np.ndarray, points:List[Tuple[int, int]], line_color:List[int], border_color:List[int], stroke_width:int, border_thickness:int, dirty:Optional[DirtyRects]=None) -> np.ndarray:
     pts = np.array(list(map(lambda x: x[::-1], points)), np.int32)
     pts = pts.reshape((-1,1,2))
     border_line = stroke_width + (border_thickness * 2)
     state = cv2.polylines(state,[pts],False,border_color, thickness = border_line)
     state = cv2.polylines(state,[pts],False,line_color, thickness = stroke_width)
+    if dirty is not None:
+        dirty.mark(pts, border_line)
     return state
 
 
-def simpleBorderPolyLine(state:np.ndarray, points:List[Tuple[int, int]]) -> np.ndarray:
-    return _borderPolyLine(state, points, [255,255,255], [0,0,0], 10, 2)
+def simpleBorderPolyLine(state:np.ndarray, points:List[Tuple[int, int]], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+    return _borderPolyLine(state, points, [255,255,255], [0,0,0], 10, 2, dirty)
+
+
+def _lookback(pts:np.ndarray, index:int, reach:float) -> int:
+    """
+    Returns the index of the point at least 'reach' pixels of path length before pts[index].
+    Only looks at as many points as it needs.
+    """
+    length = 0.0
+    window = 32
+    while index > 0:
+        first = max(index - window, 0)
+        points = pts[first:index+1].tolist()
+        for i in range(len(points) - 1, 0, -1):
+            (x1, y1), (x0, y0) = points[i], points[i-1]
+            length += math.hypot(x1 - x0, y1 - y0)
+            index -= 1
+            if length >= reach:
+                return index
+        window *= 4
+    return index
+
+def _borderPolyLineTails(state:np.ndarray, tails:List[Tuple[np.ndarray, int]], line_color:List[int], border_color:List[int], stroke_width:int, border_thickness:int, dirty:Optional[DirtyRects]=None) -> np.ndarray:
+    """
+    Draws only the newest segments of one or more border polylines.
+    Each tail is an int32 array of cv2 (x, y) points and the number of its leading points that are already drawn.
+    The border is drawn under the new segments only. The line is then redrawn far enough back over the
+    previous segments to cover the border at the joint, which keeps the border-under-line look.
+    """
+    border_line = stroke_width + (border_thickness * 2)
+    reach = border_line / 2 + stroke_width
+    border_pts = []
+    line_pts = []
+    for pts, drawn in tails:
+        if len(pts) <= drawn:
+            continue
+        start = max(drawn - 1, 0)
+        border_pts.append(pts[start:].reshape((-1,1,2)))
+        line_pts.append(pts[_lookback(pts, start, reach):].reshape((-1,1,2)))
+    if len(border_pts) == 0:
+        return state
+    state = cv2.polylines(state,border_pts,False,border_color, thickness = border_line)
+    state = cv2.polylines(state,line_pts,False,line_color, thickness = stroke_width)
+    if dirty is not None:
+        for pts in line_pts: # each line window covers its border
+            dirty.mark(pts, border_line)
+    return state
+
+def simpleBorderPolyLineTails(state:np.ndarray, tails:List[Tuple[np.ndarray, int]], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+    return _borderPolyLineTails(state, tails, [255,255,255], [0,0,0], 10, 2, dirty)
+
+
+class IncrementalBorderPolyLine:
+    """
+    A border polyline brush that only rasterizes the points added since it was last called,
+    so each call costs O(new points) instead of O(whole path).
+
+    Keeps one growable int32 point buffer, so use one instance per stroke.
+    It can be used as an agent brush as long as the points it is given are only ever appended to.
+    Unlike _borderPolyLine, where a path crosses itself the newer border is drawn over the older line.
+    """
+    def __init__(self, line_color:List[int], border_color:List[int], stroke_width:int, border_thickness:int, capacity:int=64):
+        self.line_color = line_color
+        self.border_color = border_color
+        self.stroke_width = stroke_width
+        self.border_thickness = border_thickness
+        self.points = np.empty((capacity, 2), np.int32)
+        self.count = 0
+        self.drawn = 0
+
+    def extend(self, points:List[Tuple[int, int]]) -> None:
+        """ Appends [h w] drawing points to the buffer """
+        new_points = np.asarray(points, np.int32).reshape((-1, 2))
+        end = self.count + len(new_points)
+        if end > len(self.points):
+            grown = np.empty((max(end, 2 * len(self.points)), 2), np.int32)
+            grown[:self.count] = self.points[:self.count]
+            self.points = grown
+        self.points[self.count:end] = new_points[:, ::-1] # cv2 uses (x, y)
+        self.count = end
+
+    def draw(self, state:np.ndarray, dirty:Optional[DirtyRects]=None) -> np.ndarray:
+        state = _borderPolyLineTails(state, [(self.points[:self.count], self.drawn)], self.line_color, self.border_color, self.stroke_width, self.border_thickness, dirty)
+        self.drawn = self.count
+        return state
+
+    def __call__(self, state:np.ndarray, points:List[Tuple[int, int]], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+        self.extend(points[self.count:])
+        return self.draw(state, dirty)
+
+def simpleBorderPolyLineStroke() -> IncrementalBorderPolyLine:
+    """
+    Returns a new incremental brush that draws like simpleBorderPolyLine. Use one per stroke.
+    """
+    return IncrementalBorderPolyLine([255,255,255], [0,0,0], 10, 2)
+
+
+class BidirectionalBorderPolyLine:
+    """
+    An incremental border polyline for a path that grows at both ends from its start point.
+
+    Called with the points of each end, from the start point outwards. Each end only ever grows,
+    and has its own IncrementalBorderPolyLine buffer. The new segments of both ends are drawn in one pass,
+    so near the start point neither end's border covers the other end's line.
+    """
+    def __init__(self, line_color:List[int], border_color:List[int], stroke_width:int, border_thickness:int):
+        self.line_color = line_color
+        self.border_color = border_color
+        self.stroke_width = stroke_width
+        self.border_thickness = border_thickness
+        self.ends = [IncrementalBorderPolyLine(line_color, border_color, stroke_width, border_thickness) for _ in range(2)]
+
+    def __call__(self, state:np.ndarray, ends:List[List[Tuple[int, int]]], dirty:Optional[DirtyRects]=None) -> np.ndarray:
+        tails = []
+        for buffer, points in zip(self.ends, ends):
+            buffer.extend(points[buffer.count:])
+            tails.append((buffer.points[:buffer.count], buffer.drawn))
+            buffer.drawn = buffer.count
+        return _borderPolyLineTails(state, tails, self.line_color, self.border_color, self.stroke_width, self.border_thickness, dirty)
+
+def simpleBorderPolyLineBidirectional() -> BidirectionalBorderPolyLine:
+    """
+    Returns a new two ended incremental brush that draws like simpleBorderPolyLine. Use one per stroke.
+    """
+    return BidirectionalBorderPolyLine([255,255,255], [0,0,0], 10, 2)
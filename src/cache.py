@@ -0,0 +1,75 @@
+import cv2, hashlib, json, os
+import numpy as np
+from typing import Optional
+
+from src import tools
+
+"""
+On disk cache for loaded + preprocessed input images.
+
+Entries are .npy files named after a hash of the input file contents and the preprocessing parameters,
+so editing the image or changing a parameter misses the cache, and renaming the file does not.
+"""
+
+CACHE_DIR = ".cache/images"
+MAX_CACHE_BYTES = 1 << 30 # 1GB
+
+def fileHash(path:str) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def cacheKey(path:str, **params) -> str:
+    params_str = json.dumps(params, sort_keys=True)
+    return hashlib.sha1((fileHash(path) + params_str).encode()).hexdigest()
+
+def evict(cache_dir:str, max_bytes:int) -> None:
+    """
+    Deletes the least recently used entries until the cache is no bigger than max_bytes.
+    The most recent entry is always kept.
+    """
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith(".npy"):
+            stat = os.stat(os.path.join(cache_dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    entries.sort()
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in entries[:-1]:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(os.path.join(cache_dir, name))
+        except FileNotFoundError:
+            pass # removed by another process
+        total -= size
+
+def loadQuantizedCVImage(path:str, scale_percent:int=100, clusters:int=8, rounds:int=1, sample_size:Optional[int]=None,
+        seed:Optional[int]=None, cache_dir:str=CACHE_DIR, max_bytes:int=MAX_CACHE_BYTES, mmap_mode:Optional[str]=None) -> np.ndarray:
+    """
+    tools.loadCVImage followed by tools.filterCVImage_quantizeHues, cached on disk.
+    A warm start skips the decode, resize and k-means.
+    seed: seeds k-means and the pixel sampling, so a cold cache gives the same result on every machine.
+    mmap_mode: passed to np.load. Use 'r' to memory map a read-only array or 'c' for copy-on-write.
+    """
+    key = cacheKey(path, scale_percent=scale_percent, clusters=clusters, rounds=rounds, sample_size=sample_size, seed=seed)
+    cache_path = os.path.join(cache_dir, key + ".npy")
+    if os.path.exists(cache_path):
+        os.utime(cache_path) # mark as recently used
+        return np.load(cache_path, mmap_mode=mmap_mode)
+
+    image = tools.loadCVImage(path, scale_percent=scale_percent)
+    if seed is not None:
+        cv2.setRNGSeed(seed)
+    image = tools.filterCVImage_quantizeHues(image, clusters, rounds, sample_size, rng=np.random.default_rng(seed))
+
+    os.makedirs(cache_dir, exist_ok=True)
+    # write to a temp file then rename, so other processes never load a partial entry
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, image)
+    os.replace(tmp_path, cache_path)
+    evict(cache_dir, max_bytes)
+    return image
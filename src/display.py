@@ -0,0 +1,62 @@
+import pygame
+import numpy as np
+from typing import List, Optional, Tuple
+
+from src import brushes
+
+class Display:
+    """
+    Shows the state in the pygame window, only copying the regions drawn into since the last draw.
+
+    Keeps one 32 bit Surface the size of the state and writes into it through pygame.surfarray.pixels3d,
+    instead of copying the whole state into a new Surface every frame. Only the updated regions are blitted
+    and passed to pygame.display.update.
+    Regions come from the brushes: pass display.dirty to whatever draws on the state (eg. agent.dirty).
+    After changing the state any other way, eg. blur, erode or loading an image, call draw with full=True.
+    max_rects: above this many regions, update their bounding box instead, one big copy is cheaper than many small ones.
+    """
+    def __init__(self, screen:pygame.surface.Surface, max_rects:int=256):
+        self.screen = screen
+        self.max_rects = max_rects
+        self.surface:Optional[pygame.Surface] = None # created on the first draw, with the size of the state
+        self.dirty = brushes.DirtyRects()
+
+    def clip(self, rects:List[Tuple[int, int, int, int]], w:int, h:int) -> List[Tuple[int, int, int, int]]:
+        clipped = []
+        for x, y, rw, rh in rects:
+            x0, y0 = max(x, 0), max(y, 0)
+            x1, y1 = min(x + rw, w), min(y + rh, h)
+            if x1 > x0 and y1 > y0:
+                clipped.append((x0, y0, x1 - x0, y1 - y0))
+        return clipped
+
+    def draw(self, state:np.ndarray, full:bool=False, rects:Optional[List[Tuple[int, int, int, int]]]=None) -> None:
+        """
+        rects: the regions to update, when they were collected somewhere else (eg. on another thread)
+        """
+        h, w = state.shape[:2]
+        if rects is None:
+            rects = self.dirty.take()
+        if self.surface is None:
+            self.surface = pygame.Surface((w, h), 0, 32)
+            full = True
+        if full:
+            rects = [(0, 0, w, h)]
+        rects = self.clip(rects, w, h)
+        if len(rects) == 0:
+            return
+        if len(rects) > self.max_rects:
+            x0 = min(x for x, _, _, _ in rects)
+            y0 = min(y for _, y, _, _ in rects)
+            x1 = max(x + rw for x, _, rw, _ in rects)
+            y1 = max(y + rh for _, y, _, rh in rects)
+            rects = [(x0, y0, x1 - x0, y1 - y0)]
+        pixels = pygame.surfarray.pixels3d(self.surface) # locks the surface until deleted
+        for x, y, rw, rh in rects:
+            # swap axes from cv2 [y][x] style to pygame [x][y] style and move BGR to RGB
+            pixels[x:x+rw, y:y+rh] = state[y:y+rh, x:x+rw, ::-1].swapaxes(0, 1)
+        del pixels
+        update_rects = [pygame.Rect(r) for r in rects]
+        for r in update_rects:
+            self.screen.blit(self.surface, r, r)
+        pygame.display.update(update_rects)
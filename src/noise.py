@@ -4,65 +4,114 @@ import numpy as np
 def interpolant(t):
     return t*t*t*(t*(t*6 - 15) + 10)
 
+def _generate_gradients(res, tileable, rng):
+    """Draws the (res[0]+1, res[1]+1) lattice of unit gradients.
+    Returns:
+        The cos and sin components as two float64 arrays.
+    """
+    if rng is None:
+        rng = np.random.default_rng()
+    angles = 2*np.pi*rng.random((res[0]+1, res[1]+1))
+    gradients = np.dstack((np.cos(angles), np.sin(angles)))
+    if tileable[0]:
+        gradients[-1,:] = gradients[0,:]
+    if tileable[1]:
+        gradients[:,-1] = gradients[:,0]
+    return gradients[:,:,0], gradients[:,:,1]
+
+def _perlin_chunk(gradients, rows, cols, shape, res, interpolant, dtype):
+    """Perlin noise for the lattice of rows x cols (1D index arrays).
+    Only the chunk is allocated: gradients are gathered per cell instead
+    of being repeated over the whole array.
+    Index i along an axis sits at lattice coordinate i*res/shape, so any
+    shape works, whether or not it is a multiple of res.
+    """
+    # Cell of each row / column and the position inside it, in integer
+    # arithmetic so cell boundaries are exact
+    cell_x, rem_x = np.divmod(rows * res[0], shape[0])
+    cell_y, rem_y = np.divmod(cols * res[1], shape[1])
+    grid_x = (rem_x / shape[0]).astype(dtype)[:, None]
+    grid_y = (rem_y / shape[1]).astype(dtype)[None, :]
+    gx, gy = gradients
+    x0, x1 = cell_x[:, None], cell_x[:, None] + 1
+    y0, y1 = cell_y[None, :], cell_y[None, :] + 1
+    # Ramps
+    n00 = gx[x0, y0]*grid_x     + gy[x0, y0]*grid_y
+    n10 = gx[x1, y0]*(grid_x-1) + gy[x1, y0]*grid_y
+    n01 = gx[x0, y1]*grid_x     + gy[x0, y1]*(grid_y-1)
+    n11 = gx[x1, y1]*(grid_x-1) + gy[x1, y1]*(grid_y-1)
+    # Interpolation
+    t_x = interpolant(grid_x)
+    t_y = interpolant(grid_y)
+    n0 = n00*(1-t_x) + t_x*n10
+    n1 = n01*(1-t_x) + t_x*n11
+    return dtype.type(np.sqrt(2))*((1-t_y)*n0 + t_y*n1)
+
+def _perlin_into(out, gradients, res, interpolant, chunk_size, amplitude=1, accumulate=False):
+    """Writes (or adds, when accumulate) amplitude * perlin noise into out,
+    chunk_size x chunk_size tiles at a time.
+    """
+    shape = out.shape
+    dtype = out.dtype
+    gradients = (gradients[0].astype(dtype), gradients[1].astype(dtype))
+    if chunk_size is None:
+        chunk_size = max(shape)
+    for r in range(0, shape[0], chunk_size):
+        rows = np.arange(r, min(r + chunk_size, shape[0]))
+        for c in range(0, shape[1], chunk_size):
+            cols = np.arange(c, min(c + chunk_size, shape[1]))
+            chunk = _perlin_chunk(gradients, rows, cols, shape, res, interpolant, dtype)
+            if amplitude != 1:
+                chunk *= amplitude
+            if accumulate:
+                out[rows[0]:rows[-1]+1, cols[0]:cols[-1]+1] += chunk
+            else:
+                out[rows[0]:rows[-1]+1, cols[0]:cols[-1]+1] = chunk
+    return out
+
 def generate_perlin_noise_2d(
-        shape, res, tileable=(False, False), interpolant=interpolant
+        shape, res, tileable=(False, False), interpolant=interpolant,
+        rng=None, dtype=np.float64, out=None, chunk_size=1024
 ):
     """Generate a 2D numpy array of perlin noise.
     Args:
         shape: The shape of the generated array (tuple of two ints).
-            This must be a multple of res.
         res: The number of periods of noise to generate along each
-            axis (tuple of two ints). Note shape must be a multiple of
-            res.
+            axis (tuple of two ints).
         tileable: If the noise should be tileable along each axis
             (tuple of two bools). Defaults to (False, False).
         interpolant: The interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy.random.Generator the gradients are drawn from.
+            Defaults to a new unseeded generator.
+        dtype: The float type of the noise. np.float32 halves the
+            memory used. Defaults to np.float64.
+        out: An optional preallocated (or memory mapped, see
+            np.lib.format.open_memmap) array of shape shape to write
+            the noise into. Its dtype is used instead of dtype.
+        chunk_size: The noise is computed in chunk_size x chunk_size
+            tiles, so temporaries stay the size of a tile. None computes
+            it in one go. Defaults to 1024.
     Returns:
         A numpy array of shape shape with the generated noise.
-    Raises:
-        ValueError: If shape is not a multiple of res.
     """
-    delta = (res[0] / shape[0], res[1] / shape[1])
-    d = (shape[0] // res[0], shape[1] // res[1])
-    grid = np.mgrid[0:res[0]:delta[0], 0:res[1]:delta[1]]\
-             .transpose(1, 2, 0) % 1
-    # Gradients
-    angles = 2*np.pi*np.random.rand(res[0]+1, res[1]+1)
-    gradients = np.dstack((np.cos(angles), np.sin(angles)))
-    if tileable[0]:
-        gradients[-1,:] = gradients[0,:]
-    if tileable[1]:
-        gradients[:,-1] = gradients[:,0]
-    gradients = gradients.repeat(d[0], 0).repeat(d[1], 1)
-    g00 = gradients[    :-d[0],    :-d[1]]
-    g10 = gradients[d[0]:     ,    :-d[1]]
-    g01 = gradients[    :-d[0],d[1]:     ]
-    g11 = gradients[d[0]:     ,d[1]:     ]
-    # Ramps
-    n00 = np.sum(np.dstack((grid[:,:,0]  , grid[:,:,1]  )) * g00, 2)
-    n10 = np.sum(np.dstack((grid[:,:,0]-1, grid[:,:,1]  )) * g10, 2)
-    n01 = np.sum(np.dstack((grid[:,:,0]  , grid[:,:,1]-1)) * g01, 2)
-    n11 = np.sum(np.dstack((grid[:,:,0]-1, grid[:,:,1]-1)) * g11, 2)
-    # Interpolation
-    t = interpolant(grid)
-    n0 = n00*(1-t[:,:,0]) + t[:,:,0]*n10
-    n1 = n01*(1-t[:,:,0]) + t[:,:,0]*n11
-    return np.sqrt(2)*((1-t[:,:,1])*n0 + t[:,:,1]*n1)
+    gradients = _generate_gradients(res, tileable, rng)
+    if out is None:
+        out = np.empty(shape, dtype=dtype)
+    return _perlin_into(out, gradients, res, interpolant, chunk_size)
 
 
 def generate_fractal_noise_2d(
         shape, res, octaves=1, persistence=0.5,
         lacunarity=2, tileable=(False, False),
-        interpolant=interpolant
+        interpolant=interpolant, rng=None,
+        dtype=np.float64, out=None, chunk_size=1024
 ):
     """Generate a 2D numpy array of fractal noise.
     Args:
         shape: The shape of the generated array (tuple of two ints).
-            This must be a multiple of lacunarity**(octaves-1)*res.
         res: The number of periods of noise to generate along each
-            axis (tuple of two ints). Note shape must be a multiple of
-            (lacunarity**(octaves-1)*res).
+            axis (tuple of two ints).
         octaves: The number of octaves in the noise. Defaults to 1.
         persistence: The scaling factor between two octaves.
         lacunarity: The frequency factor between two octaves.
@@ -70,20 +119,29 @@ def generate_fractal_noise_2d(
             (tuple of two bools). Defaults to (False, False).
         interpolant: The, interpolation function, defaults to
             t*t*t*(t*(t*6 - 15) + 10).
+        rng: The numpy.random.Generator the gradients are drawn from.
+            Defaults to a new unseeded generator.
+        dtype: The float type of the noise. Defaults to np.float64.
+        out: An optional preallocated (or memory mapped) array of
+            shape shape. Octaves are accumulated into it in place.
+        chunk_size: The tile size octaves are computed in, see
+            generate_perlin_noise_2d. Defaults to 1024.
     Returns:
         A numpy array of fractal noise and of shape shape generated by
         combining several octaves of perlin noise.
-    Raises:
-        ValueError: If shape is not a multiple of
-            (lacunarity**(octaves-1)*res).
     """
-    noise = np.zeros(shape)
+    if rng is None:
+        rng = np.random.default_rng()
+    if out is None:
+        out = np.zeros(shape, dtype=dtype)
+    else:
+        out[...] = 0
     frequency = 1
     amplitude = 1
     for _ in range(octaves):
-        noise += amplitude * generate_perlin_noise_2d(
-            shape, (frequency*res[0], frequency*res[1]), tileable, interpolant
-        )
+        octave_res = (frequency*res[0], frequency*res[1])
+        gradients = _generate_gradients(octave_res, tileable, rng)
+        _perlin_into(out, gradients, octave_res, interpolant, chunk_size, amplitude, accumulate=True)
         frequency *= lacunarity
         amplitude *= persistence
-    return noise
+    return out
@@ -0,0 +1,92 @@
+import cv2, math
+import numpy as np
+from typing import Dict, Tuple, List, Optional
+
+from src import tools
+
+class OccupancyGrid:
+    """
+    One byte per pixel record of where lines have been drawn.
+
+    Kept separate from the state so collision checks do not depend on the canvas colours,
+    which change once the state is blurred or eroded.
+    Share one grid between everything drawing on the same state, so each of them sees the others' lines.
+    Positions are in drawing [h w] order, like agent positions.
+    """
+    def __init__(self, shape:Tuple[int, int]):
+        self.grid = np.zeros(shape[:2], dtype=np.uint8)
+
+    def markLine(self, start:Tuple[int, int], end:Tuple[int, int], stroke_width:int=1) -> None:
+        # rasterize with the same cv2.line call that draws the line on the state
+        cv2.line(self.grid, start[::-1], end[::-1], 1, stroke_width)
+
+    def hitsLine(self, start:Tuple[int, int], end:Tuple[int, int]) -> bool:
+        """
+        True if a pixel on the line between start and end is occupied. Both end points are not checked.
+        """
+        points = tools.get_line_array(end[0], end[1], start[0], start[1])[1:-1]
+        return bool(self.grid[points[:, 0], points[:, 1]].any())
+
+    def markPoints(self, points:np.ndarray) -> None:
+        """ Marks already rasterized lines, points is an (m, 2) array of positions """
+        self.grid[points[:, 0], points[:, 1]] = 1
+
+    def hitsLines(self, starts:np.ndarray, ends:np.ndarray, ordered:bool=False) -> np.ndarray:
+        """
+        Checks many lines at once. starts and ends are (n, 2) arrays of positions.
+        Returns an (n,) bool array, True where a pixel between start and end is occupied.
+        ordered: also count the pixels of the lines before each line as occupied, as if they were drawn first.
+            Lines that are hit themselves still count, so this can stop a few more lines than checking one at a time would.
+        """
+        # walk from the end back to the start, like the per-pixel check did
+        points, line_ids = tools.get_lines(ends, starts)
+        count = len(starts)
+        if len(points) == 0:
+            return np.zeros(count, dtype=bool)
+        new_line = line_ids[1:] != line_ids[:-1]
+        interior = ~np.concatenate(([True], new_line)) & ~np.concatenate((new_line, [True]))
+        occupied = self.grid[points[:, 0], points[:, 1]] > 0
+        if ordered:
+            # the first line through each pixel claims it
+            flat = points[:, 0] * self.grid.shape[1] + points[:, 1]
+            order = np.lexsort((line_ids, flat))
+            sorted_flat = flat[order]
+            group_firsts = np.concatenate(([True], sorted_flat[1:] != sorted_flat[:-1]))
+            claimed_by = np.empty_like(line_ids)
+            claimed_by[order] = line_ids[order][group_firsts][np.cumsum(group_firsts) - 1]
+            occupied |= claimed_by < line_ids
+        hits = np.bincount(line_ids[interior], weights=occupied[interior], minlength=count)
+        return hits > 0
+
+class PathGrid:
+    """
+    Spatial hash of points sampled along paths, to find out if a position is close to another path.
+
+    Points are kept per cell of cell_size x cell_size pixels, so a search only looks at the cells
+    around the position instead of every point of every path.
+    Positions are in drawing [h w] order, like agent positions.
+    """
+    def __init__(self, cell_size:float):
+        self.cell_size = cell_size
+        self.cells:Dict[Tuple[int, int], List[Tuple[float, float, int]]] = {}
+
+    def cellOf(self, position:Tuple[float, float]) -> Tuple[int, int]:
+        return (int(position[0] // self.cell_size), int(position[1] // self.cell_size))
+
+    def add(self, position:Tuple[float, float], path_id:int) -> None:
+        self.cells.setdefault(self.cellOf(position), []).append((position[0], position[1], path_id))
+
+    def isNear(self, position:Tuple[float, float], distance:float, ignore_id:Optional[int]=None) -> bool:
+        """
+        True if a point of a path other than ignore_id is within distance of position.
+        """
+        reach = math.ceil(distance / self.cell_size)
+        cx, cy = self.cellOf(position)
+        x, y = position
+        limit = distance * distance
+        for i in range(cx - reach, cx + reach + 1):
+            for j in range(cy - reach, cy + reach + 1):
+                for px, py, path_id in self.cells.get((i, j), ()):
+                    if path_id != ignore_id and (px - x) ** 2 + (py - y) ** 2 < limit:
+                        return True
+        return False
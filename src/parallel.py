@@ -0,0 +1,101 @@
+import functools, multiprocessing
+import numpy as np
+from multiprocessing.sharedctypes import RawArray
+from typing import List, Optional, Tuple, Any
+
+from src import agents
+from src import brushes
+
+"""
+Renders VectorFieldWalkerPopulations across a process pool.
+
+Walkers only read the terrain and only draw along their own paths, so the population is split into
+a fixed number of tiles (groups of walkers). Each tile is stepped to completion in a worker process,
+drawing into its own transparent layer, and the layers are composited onto the state in tile order.
+The result only depends on the seed and the number of tiles, not on the number of processes.
+"""
+
+# the simpleBorderPolyLineTails brush, with an opaque alpha so the layer records where it drew
+_layerBrush = functools.partial(brushes._borderPolyLineTails, line_color=[255,255,255,255], border_color=[0,0,0,255], stroke_width=10, border_thickness=2)
+
+# set in each worker by _initWorker
+_terrain:Optional[agents.UnitVectorField] = None
+
+def _initWorker(shared_terrain:Any, shape:Tuple[int, int]) -> None:
+    global _terrain
+    # view of the terrain shared by every worker, no copy. Read only, so no worker can change it under the others.
+    terrain = np.frombuffer(shared_terrain, dtype=np.float64).reshape(shape)
+    terrain.setflags(write=False)
+    _terrain = agents.UnitVectorField(terrain)
+
+def _renderTile(args:Tuple[np.ndarray, np.ndarray, float, int, int, Tuple[int, int], Optional[int]]) -> Tuple[int, Optional[Tuple[int, int, np.ndarray]]]:
+    """
+    Steps one tile of walkers until they are all dead or max_steps is reached.
+    Returns the number of steps taken and the cropped BGRA layer with its (row, col) offset, or None if nothing was drawn.
+    """
+    positions, directions_rads, magnitude, lifespan, aging_rate, canvas_shape, max_steps = args
+    population = agents.VectorFieldWalkerPopulation([], positions, magnitude, directions_rads)
+    population.lifespan = lifespan
+    population.aging_rate = aging_rate
+    population.brush = _layerBrush
+    layer = np.zeros((canvas_shape[0], canvas_shape[1], 4), dtype=np.uint8)
+    step = 0
+    while not population.dead and (max_steps is None or step < max_steps):
+        layer = population.doStep(step, layer, _terrain)
+        step += 1
+    rows, cols = np.nonzero(layer[..., 3])
+    if len(rows) == 0:
+        return step, None
+    r0, r1, c0, c1 = rows.min(), rows.max() + 1, cols.min(), cols.max() + 1
+    return step, (r0, c0, layer[r0:r1, c0:c1].copy())
+
+def compositeLayer(state:np.ndarray, offset_row:int, offset_col:int, layer:np.ndarray) -> np.ndarray:
+    region = state[offset_row:offset_row+layer.shape[0], offset_col:offset_col+layer.shape[1]]
+    drawn = layer[..., 3] > 0
+    region[drawn] = layer[..., :3][drawn]
+    return state
+
+def renderPopulation(state:np.ndarray, terrain:np.ndarray, population:agents.VectorFieldWalkerPopulation,
+        processes:Optional[int]=None, tiles:int=32, max_steps:Optional[int]=None) -> Tuple[np.ndarray, int]:
+    """
+    Runs a new (not yet stepped) population to completion, or for max_steps, across 'processes' worker processes
+    and draws it onto the state.
+    Returns the state and the number of steps the population took.
+    Where the workers are forked (the default on Linux), call it before starting any threads (eg. a VideoRecorder).
+    Where they are spawned, they import the __main__ script again, so it must guard its main() call.
+    processes: defaults to the number of CPUs.
+    tiles: the number of groups the walkers are split into. Keep it fixed for identical results.
+    """
+    if isinstance(terrain, agents.UnitVectorField):
+        terrain = terrain.terrain
+    terrain = np.ascontiguousarray(terrain, dtype=np.float64)
+    shared_terrain = RawArray('d', terrain.size)
+    np.frombuffer(shared_terrain, dtype=np.float64)[:] = terrain.ravel()
+
+    groups = np.array_split(np.arange(len(population.positions)), tiles)
+    tasks = [(population.positions[g], population.directions_rads[g], population.magnitude,
+            population.lifespan, population.aging_rate, state.shape[:2], max_steps) for g in groups if len(g) > 0]
+    steps = 0
+    with multiprocessing.Pool(processes, initializer=_initWorker, initargs=(shared_terrain, terrain.shape)) as pool:
+        # map keeps the tile order, so layers are composited the same way every time
+        for tile_steps, layer in pool.map(_renderTile, tasks, chunksize=1):
+            steps = max(steps, tile_steps) # the tiles step side by side
+            if layer is not None:
+                state = compositeLayer(state, *layer)
+    population.die()
+    return state, steps
+
+def renderPopulations(state:np.ndarray, terrain:np.ndarray, agent_buffer:List[agents.Agent],
+        processes:Optional[int]=None, tiles:int=32, max_steps:Optional[int]=None) -> Tuple[np.ndarray, int]:
+    """
+    Renders every VectorFieldWalkerPopulation in the agent buffer with renderPopulation, in buffer order,
+    and removes them from the buffer. Other agents are left for the normal update loop.
+    Returns the state and the steps taken, the most any population took since they would have stepped side by side.
+    """
+    steps = 0
+    for agent in agent_buffer:
+        if isinstance(agent, agents.VectorFieldWalkerPopulation) and not agent.dead:
+            state, population_steps = renderPopulation(state, terrain, agent, processes, tiles, max_steps)
+            steps = max(steps, population_steps)
+    agent_buffer[:] = [a for a in agent_buffer if not isinstance(a, agents.VectorFieldWalkerPopulation)]
+    return state, steps
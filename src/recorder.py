@@ -0,0 +1,87 @@
+import cv2, os, queue, threading
+import numpy as np
+from typing import Optional
+
+class VideoRecorder:
+    """
+    Encodes frames on a background thread as they are produced, instead of keeping every frame until the end.
+
+    At most max_queued frames wait to be encoded. record() blocks while the queue is full,
+    so memory use stays flat however long the run is.
+    The video is written to a temp file next to file_path and only moved there by save().
+    Only supports avi + divx for now, like tools.writeStateHistoryToVideo.
+    If encoding raises, the thread stops and the next record, close or save raises the error on the calling thread.
+    """
+    def __init__(self, file_path:str, fps:int=60, max_queued:int=32):
+        self.file_path = file_path
+        root, ext = os.path.splitext(file_path)
+        self.tmp_path = f"{root}.partial{ext}" # keep the extension, cv2 picks the container from it
+        self.fps = fps
+        self.frame_count = 0
+        self.frames:queue.Queue = queue.Queue(max_queued)
+        self.writer = None # opened with the size of the first frame
+        self.error:Optional[BaseException] = None
+        directory = os.path.dirname(file_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.thread = threading.Thread(target=self._encode, daemon=True)
+        self.thread.start()
+
+    def record(self, state:np.ndarray) -> None:
+        self._put(state.copy())
+        self.frame_count += 1
+
+    def _put(self, frame:Optional[np.ndarray]) -> None:
+        """ Queues frame, raising instead of blocking forever if the encoder thread has died """
+        while True:
+            self.raiseError()
+            if not self.thread.is_alive():
+                raise RuntimeError("VideoRecorder encoder thread is not running")
+            try:
+                self.frames.put(frame, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def _encode(self) -> None:
+        try:
+            while True:
+                frame = self.frames.get()
+                if frame is None:
+                    break
+                if self.writer is None:
+                    frame_height, frame_width, _ = frame.shape
+                    self.writer = cv2.VideoWriter(self.tmp_path, cv2.VideoWriter_fourcc('D', 'I', 'V', 'X'), self.fps, (frame_width,frame_height))
+                frame = np.ascontiguousarray(frame[...,::-1]) # convert RGB to BGR as expected by divx codec
+                self.writer.write(frame)
+        except BaseException as e:
+            self.error = e
+        finally:
+            if self.writer is not None:
+                self.writer.release()
+
+    def raiseError(self) -> None:
+        """ Raises the error encoding raised, if any """
+        if self.error is not None:
+            raise self.error
+
+    def close(self) -> None:
+        """
+        Waits for every queued frame to be encoded.
+        """
+        if self.thread.is_alive():
+            self._put(None)
+            self.thread.join()
+        self.raiseError()
+
+    def save(self) -> None:
+        self.close()
+        if os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.file_path)
+
+    def discard(self) -> None:
+        try:
+            self.close()
+        finally:
+            if os.path.exists(self.tmp_path):
+                os.remove(self.tmp_path)
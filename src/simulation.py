@@ -0,0 +1,118 @@
+import queue, threading
+import numpy as np
+from typing import Any, Callable, List, Optional, Tuple
+
+from src import brushes
+from src.display import Display
+
+class SimulationThread:
+    """
+    Steps the simulation on a background thread, so slow steps do not hold up drawing and event handling.
+
+    The thread owns the working state. Whenever the display has taken the last frame, it copies the state into
+    the published frame (the second buffer), along with the regions drawn into since then.
+    The display swaps the published frame for its own buffer under the lock and draws it after letting go,
+    so it never sees a half copied state and drawing never holds up the steps.
+    Anything that changes the simulation, like adding agents, is sent as a command and run on the simulation
+    thread between two steps. Most of a step is OpenCV drawing, which releases the GIL, so the threads overlap.
+    If a step raises, the thread stops and drawFrame or stop raises the error on the calling thread.
+
+    step_function(step, state) runs one step and returns the state.
+    idle() is True when there is nothing to step (eg. no agents left). The thread then waits for a command instead.
+    dirty: where the brushes of the step function record what they draw. Only used by the thread while it runs.
+    """
+    def __init__(self, state:np.ndarray, step_function:Callable[[int, np.ndarray], np.ndarray], step:int=0,
+            idle:Optional[Callable[[], bool]]=None, dirty:Optional[brushes.DirtyRects]=None):
+        self.state = state
+        self.step_function = step_function
+        self.step = step
+        self.idle = idle if idle is not None else lambda: False
+        self.dirty = dirty if dirty is not None else brushes.DirtyRects()
+        self.commands:queue.Queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.frame = state.copy()
+        self.drawn_frame = state.copy() # the display's buffer, swapped with frame
+        self.error:Optional[BaseException] = None
+        self.frame_rects:List[Tuple[int, int, int, int]] = []
+        self.frame_steps = 0 # steps since the display took a frame
+        self.frame_wanted = True
+        self.new_frame = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def send(self, command:Callable[..., Any], *args:Any) -> None:
+        """ Runs command(*args) on the simulation thread before its next step """
+        self.commands.put((command, args))
+
+    def _runCommands(self, wait:bool) -> None:
+        if wait:
+            command, args = self.commands.get()
+            command(*args)
+        while not self.commands.empty():
+            command, args = self.commands.get()
+            command(*args)
+
+    def _run(self) -> None:
+        try:
+            while not self.stopping.is_set():
+                self._runCommands(wait=self.idle())
+                if not self.stopping.is_set() and not self.idle():
+                    self._step()
+        except BaseException as e:
+            self.error = e
+
+    def _step(self) -> None:
+        self.state = self.step_function(self.step, self.state)
+        self.step += 1
+        with self.lock:
+            self.frame_steps += 1
+            if self.frame_wanted:
+                np.copyto(self.frame, self.state)
+                self.frame_rects.extend(self.dirty.take())
+                self.frame_wanted = False
+                self.new_frame = True
+
+    def drawFrame(self, display:Display) -> int:
+        """
+        Draws the newest frame, if there is one the display has not drawn yet.
+        Returns the number of steps run since the last call.
+        """
+        self.raiseError()
+        rects = None
+        with self.lock:
+            if self.new_frame:
+                self.frame, self.drawn_frame = self.drawn_frame, self.frame
+                rects = self.frame_rects
+                self.frame_rects = []
+                self.new_frame = False
+                self.frame_wanted = True
+            steps = self.frame_steps
+            self.frame_steps = 0
+        if rects is not None:
+            display.draw(self.drawn_frame, rects=rects)
+        return steps
+
+    def raiseError(self) -> None:
+        """ Raises the error a step raised, if any """
+        if self.error is not None:
+            raise self.error
+
+    def stop(self) -> np.ndarray:
+        """
+        Stops after the current step and returns the state.
+        The regions of a published frame the display has not drawn yet go back into dirty,
+        so drawing the returned state with the rects in dirty covers them.
+        """
+        self.stopping.set()
+        self.commands.put((lambda: None, ())) # wakes the thread if it is waiting for a command
+        self.thread.join()
+        with self.lock:
+            self.dirty.rects[:0] = self.frame_rects
+            self.frame_rects = []
+            self.new_frame = False
+        self.raiseError()
+        self._runCommands(wait=False)
+        return self.state
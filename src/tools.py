@@ -1,7 +1,7 @@
 from PIL import Image
 import numpy as np
-import cv2
-from typing import List, Any
+import cv2, functools
+from typing import List, Any, Tuple, Optional
 
 def loadCVImage(path:str, scale_percent:int = 100) -> Any:
     """
@@ -17,20 +17,60 @@ def loadCVImage(path:str, scale_percent:int = 100) -> Any:
     img = cv2.resize(img, dim, interpolation = cv2.INTER_AREA)
     return img
 
-def filterCVImage_quantizeHues(image, clusters=8, rounds=1):
-    w, h = image.shape[:2]
-    samples = np.zeros([h*w,3], dtype=np.float32)
-    count = 0
+KMEANS_CRITERIA = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.0001)
 
-    for x in range(w):
-        for y in range(h):
-            samples[count] = image[x][y]
-            count += 1
+def fitHuePalette(image:np.ndarray, clusters:int=8, rounds:int=1, sample_size:Optional[int]=None, rng:Optional[np.random.Generator]=None) -> np.ndarray:
+    """
+    Runs k-means over the image colours and returns the (clusters, 3) float32 palette centres.
+    sample_size: fit on this many randomly picked pixels instead of every pixel. No pixel is picked twice.
+    The palette can be reused on other frames or images with applyPalette.
+    k-means picks its starting centres with the cv2 RNG, seed it with cv2.setRNGSeed for repeatable palettes.
+    """
+    samples = image.reshape((-1, 3))
+    if sample_size is not None and sample_size < len(samples):
+        if rng is None:
+            rng = np.random.default_rng()
+        samples = samples[rng.choice(len(samples), sample_size, replace=False)]
+    compactness, labels, centers = cv2.kmeans(samples.astype(np.float32),
+            clusters,
+            None,
+            KMEANS_CRITERIA,
+            rounds,
+            cv2.KMEANS_RANDOM_CENTERS)
+    return centers
+
+def applyPalette(image:np.ndarray, centers:np.ndarray, chunk_size:int=1<<18) -> np.ndarray:
+    """
+    Replaces each pixel with its nearest palette centre. No k-means is run.
+    Pixels are assigned chunk_size at a time to keep the distance table small.
+    """
+    pixels = image.reshape((-1, 3))
+    centers = np.asarray(centers, dtype=np.float32)
+    # |p - c|^2 = |p|^2 - 2p.c + |c|^2, and |p|^2 is the same for every centre
+    center_norms = (centers * centers).sum(axis=1)
+    labels = np.empty(len(pixels), dtype=np.intp)
+    for start in range(0, len(pixels), chunk_size):
+        chunk = pixels[start:start+chunk_size].astype(np.float32)
+        labels[start:start+chunk_size] = (center_norms - 2 * chunk @ centers.T).argmin(axis=1)
+    return np.uint8(centers)[labels].reshape(image.shape[:2] + (3,))
+
+def filterCVImage_quantizeHues(image, clusters=8, rounds=1, sample_size=None, palette=None, rng=None):
+    """
+    Reduces the image to 'clusters' colours with k-means.
+    sample_size: fit the palette on this many random pixels (picked with rng), then assign every pixel to it.
+    palette: precomputed centres (see fitHuePalette). k-means is skipped entirely.
+    """
+    if palette is not None:
+        return applyPalette(image, palette)
+    if sample_size is not None:
+        return applyPalette(image, fitHuePalette(image, clusters, rounds, sample_size, rng))
+    w, h = image.shape[:2]
+    samples = image.reshape((-1, 3)).astype(np.float32)
 
     compactness, labels, centers = cv2.kmeans(samples,
             clusters,
             None,
-            (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 10000, 0.0001),
+            KMEANS_CRITERIA,
             rounds,
             cv2.KMEANS_RANDOM_CENTERS)
 
@@ -91,6 +131,14 @@ def writeStateHistoryToVideo(file_path:str, stateHistory:List[np.ndarray]) -> No
         out.write(frame)
     out.release()
 
+def removeDead(agents:List[Any]) -> List[Any]:
+    """
+    Removes every agent with agent.dead set, in one pass and keeping the step order of the rest.
+    The list is changed in place because agents hold a reference to it to spawn into.
+    """
+    agents[:] = [agent for agent in agents if not agent.dead]
+    return agents
+
 """
 Return a list of points on a line between two points.
 """
@@ -128,6 +176,46 @@ def get_line(x1, y1, x2, y2):
         points.reverse()
     return points
 
+@functools.lru_cache(maxsize=4096)
+def _line_offsets(dx:int, dy:int) -> np.ndarray:
+    """
+    Offsets of the get_line points from its first point.
+    Bresenham only depends on (dx, dy), so one template serves every line with the same deltas.
+    """
+    offsets = np.array(get_line(0, 0, dx, dy), dtype=np.int64)
+    offsets.setflags(write=False) # shared between callers
+    return offsets
+
+def get_line_array(x1:int, y1:int, x2:int, y2:int) -> np.ndarray:
+    """
+    Same points as get_line, as an (n, 2) array.
+    """
+    return _line_offsets(int(x2 - x1), int(y2 - y1)) + (x1, y1)
+
+def get_lines(starts:np.ndarray, ends:np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Rasterizes many lines at once. starts and ends are (n, 2) arrays.
+    Returns (points, line_ids):
+        points is an (m, 2) array of every line's get_line points, line after line.
+        line_ids is an (m,) array of the index of the line each point belongs to.
+    """
+    starts = np.asarray(starts, dtype=np.int64).reshape((-1, 2))
+    ends = np.asarray(ends, dtype=np.int64).reshape((-1, 2))
+    if len(starts) == 0:
+        return np.zeros((0, 2), dtype=np.int64), np.zeros(0, dtype=np.int64)
+    # lines in the same direction and length share a template
+    deltas, inverse = np.unique(ends - starts, axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    templates = [_line_offsets(dx, dy) for dx, dy in deltas.tolist()]
+    template_lengths = np.array([len(t) for t in templates])
+    template_firsts = np.cumsum(template_lengths) - template_lengths
+    lengths = template_lengths[inverse]
+    line_ids = np.repeat(np.arange(len(starts)), lengths)
+    line_firsts = np.cumsum(lengths) - lengths
+    index_in_line = np.arange(len(line_ids)) - line_firsts[line_ids]
+    points = np.concatenate(templates)[template_firsts[inverse][line_ids] + index_in_line] + starts[line_ids]
+    return points, line_ids
+
 def erode(size, image):
     # Creating kernel
     kernel = np.ones((size, size), np.uint8)
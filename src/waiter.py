@@ -14,3 +14,64 @@ class Waiter:
 
     def startWait(self):
         self.wait_until = time.time() + self.wait_for_seconds
+
+class FrameScheduler:
+    """
+    Runs as many simulation steps as fit in each frame, then draws once, so slow drawing does not slow down the simulation.
+
+    Use it like:
+        scheduler.startFrame()
+        while scheduler.stepDue():
+            ...one step...
+        ...draw...
+        scheduler.endFrame()
+
+    A frame lasts 1 / max_fps seconds. Steps stop early enough to leave time for the draw, estimated from the last frame,
+    and a frame that ends early sleeps, which caps the drawing at max_fps. At least one step runs per frame, so when a
+    single step takes longer than a frame, events are still handled and the state drawn after every step.
+    Sim steps/s and render frames/s are printed every report_every seconds.
+    """
+    def __init__(self, max_fps:float=60, report_every:float=2):
+        self.frame_time = 1 / max_fps
+        self.report_every = report_every
+        self.frame_start = time.perf_counter()
+        self.frame_steps = 0
+        self.draw_start = self.frame_start
+        self.draw_time = 0.0
+        self.report_start = self.frame_start
+        self.report_steps = 0
+        self.report_frames = 0
+
+    def startFrame(self) -> None:
+        self.frame_start = time.perf_counter()
+        self.draw_start = self.frame_start
+        self.frame_steps = 0
+
+    def countSteps(self, steps:int) -> None:
+        """ Counts steps run somewhere else, eg. on a SimulationThread, instead of with stepDue """
+        self.frame_steps += steps
+
+    def stepDue(self) -> bool:
+        now = time.perf_counter()
+        if self.frame_steps > 0:
+            step_time = (now - self.frame_start) / self.frame_steps
+            if now + step_time + self.draw_time > self.frame_start + self.frame_time:
+                self.draw_start = now
+                return False
+        self.frame_steps += 1
+        return True
+
+    def endFrame(self) -> None:
+        now = time.perf_counter()
+        self.draw_time = now - self.draw_start
+        self.report_steps += self.frame_steps
+        self.report_frames += 1
+        if now - self.report_start >= self.report_every:
+            elapsed = now - self.report_start
+            print(f"sim steps/s: {self.report_steps/elapsed:.1f}\trender fps: {self.report_frames/elapsed:.1f}")
+            self.report_start = now
+            self.report_steps = 0
+            self.report_frames = 0
+        remaining = self.frame_start + self.frame_time - now
+        if remaining > 0:
+            time.sleep(remaining)
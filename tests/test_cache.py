@@ -0,0 +1,17 @@
+from src import cache
+
+"""
+Run from the repository root with python -m pytest.
+"""
+
+def test_cacheKey_follows_contents_and_params(tmp_path):
+    image = tmp_path / "a.png"
+    image.write_bytes(b"first")
+    key = cache.cacheKey(str(image), scale_percent=50, clusters=8)
+    assert cache.cacheKey(str(image), clusters=8, scale_percent=50) == key
+    assert cache.cacheKey(str(image), scale_percent=50, clusters=9) != key
+    renamed = tmp_path / "b.png"
+    image.rename(renamed)
+    assert cache.cacheKey(str(renamed), scale_percent=50, clusters=8) == key
+    renamed.write_bytes(b"second")
+    assert cache.cacheKey(str(renamed), scale_percent=50, clusters=8) != key
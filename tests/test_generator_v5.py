@@ -0,0 +1,38 @@
+import numpy as np
+
+import generator_v5
+
+"""
+Run from the repository root with python -m pytest.
+"""
+
+def test_BoxelField_visitMany_matches_visit():
+    rng = np.random.default_rng(7)
+    batched = generator_v5.BoxelField(10, 10, np.random.default_rng(8))
+    sequential = generator_v5.BoxelField(10, 10, np.random.default_rng(8))
+    for step in range(1, 40):
+        rows = rng.integers(10, size=15)
+        cols = rng.integers(10, size=15)
+        batched.visitMany(step, rows, cols)
+        for row, col in zip(rows, cols):
+            sequential.visit(step, row, col)
+            if sequential.isDead(row, col):
+                sequential.respawn(row, col)
+        # respawns draw their random mode in a different order, so compare the energy bookkeeping only
+        np.testing.assert_array_equal(batched.energy, sequential.energy)
+        np.testing.assert_array_equal(batched.last_step_visited, sequential.last_step_visited)
+
+def test_BoxelField_energyAt_matches_scalar():
+    rng = np.random.default_rng(6)
+    field = generator_v5.BoxelField(20, 30, rng)
+    field.energy[:] = rng.integers(-50, 100, size=field.energy.shape)
+    field.last_step_visited[:] = rng.integers(0, 100, size=field.energy.shape)
+    energy = field.energyAt(120)
+    for row in range(20):
+        for col in range(30):
+            assert energy[row, col] == field.energyAt(120, row, col)
+            if field.energy[row, col] <= 0:
+                assert energy[row, col] == field.energy[row, col] # dead boxels do not regenerate
+            else:
+                regenerated = field.energy[row, col] + 120 - field.last_step_visited[row, col]
+                assert energy[row, col] == min(field.max_energy[row, col], regenerated)
@@ -0,0 +1,19 @@
+import numpy as np
+import pytest
+
+from src import noise
+
+"""
+Run from the repository root with python -m pytest.
+"""
+
+@pytest.mark.parametrize("tileable", [(False, False), (True, True)])
+def test_perlin_noise_chunked_matches_unchunked(tileable):
+    whole = noise.generate_perlin_noise_2d((60, 80), (3, 4), tileable, rng=np.random.default_rng(4), chunk_size=None)
+    chunked = noise.generate_perlin_noise_2d((60, 80), (3, 4), tileable, rng=np.random.default_rng(4), chunk_size=7)
+    np.testing.assert_allclose(chunked, whole)
+
+def test_fractal_noise_chunked_matches_unchunked():
+    whole = noise.generate_fractal_noise_2d((64, 64), (2, 2), octaves=3, rng=np.random.default_rng(5), chunk_size=None)
+    chunked = noise.generate_fractal_noise_2d((64, 64), (2, 2), octaves=3, rng=np.random.default_rng(5), chunk_size=10)
+    np.testing.assert_allclose(chunked, whole)
@@ -0,0 +1,40 @@
+import numpy as np
+
+from src import tools
+from src.occupancy import OccupancyGrid
+
+"""
+Run from the repository root with python -m pytest.
+"""
+
+def randomLines(rng:np.random.Generator, count:int, size:int) -> tuple:
+    starts = rng.integers(size, size=(count, 2))
+    ends = rng.integers(size, size=(count, 2))
+    ends[:3] = starts[:3] # zero length lines
+    return starts, ends
+
+def markedGrid(rng:np.random.Generator, lines:int, size:int) -> OccupancyGrid:
+    occupancy = OccupancyGrid((size, size))
+    for start, end in zip(*randomLines(rng, lines, size)):
+        occupancy.markLine(tuple(start), tuple(end))
+    return occupancy
+
+def test_hitsLines_matches_hitsLine():
+    rng = np.random.default_rng(2)
+    occupancy = markedGrid(rng, 10, 40)
+    starts, ends = randomLines(rng, 100, 40)
+    expected = [occupancy.hitsLine(tuple(start), tuple(end)) for start, end in zip(starts, ends)]
+    assert occupancy.hitsLines(starts, ends).tolist() == expected
+
+def test_hitsLines_ordered_counts_earlier_lines():
+    rng = np.random.default_rng(3)
+    occupancy = markedGrid(rng, 5, 40)
+    starts, ends = randomLines(rng, 60, 40)
+    # check one line at a time, marking every line after it is checked, hit or not
+    sequential = OccupancyGrid((40, 40))
+    sequential.grid[:] = occupancy.grid
+    expected = []
+    for start, end in zip(starts, ends):
+        expected.append(sequential.hitsLine(tuple(start), tuple(end)))
+        sequential.markPoints(tools.get_line_array(end[0], end[1], start[0], start[1]))
+    assert occupancy.hitsLines(starts, ends, ordered=True).tolist() == expected
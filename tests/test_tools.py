@@ -0,0 +1,30 @@
+import numpy as np
+
+from src import tools
+
+"""
+Run from the repository root with python -m pytest.
+"""
+
+def randomLines(rng:np.random.Generator, count:int, size:int) -> tuple:
+    starts = rng.integers(size, size=(count, 2))
+    ends = rng.integers(size, size=(count, 2))
+    ends[:3] = starts[:3] # zero length lines
+    return starts, ends
+
+def test_get_line_array_matches_get_line():
+    rng = np.random.default_rng(0)
+    for (x1, y1), (x2, y2) in zip(*randomLines(rng, 200, 50)):
+        assert tools.get_line_array(x1, y1, x2, y2).tolist() == [list(p) for p in tools.get_line(x1, y1, x2, y2)]
+
+def test_get_lines_matches_get_line_array():
+    rng = np.random.default_rng(1)
+    starts, ends = randomLines(rng, 200, 50)
+    points, line_ids = tools.get_lines(starts, ends)
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        expected = tools.get_line_array(start[0], start[1], end[0], end[1])
+        np.testing.assert_array_equal(points[line_ids == i], expected)
+
+def test_get_lines_empty():
+    points, line_ids = tools.get_lines(np.zeros((0, 2)), np.zeros((0, 2)))
+    assert points.shape == (0, 2) and len(line_ids) == 0